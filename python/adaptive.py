@@ -0,0 +1,220 @@
+# Adaptive evaluation of the test matrix. Instead of running every case on every model, the cases run
+# round by round in the order of how well they separated the models in past runs, and a model stops
+# as soon as its outcome is decided: it can't reach the pass threshold or the target rank anymore even
+# if it passed all remaining cases, or it is certain to reach them. A cell is only sampled again if its
+# outcome is uncertain, i.e. the samples of this and past runs disagree, until the majority is clear or
+# --max-samples is reached. The report lists the bounds and ranking confidence of every model and the
+# calls saved compared with the full matrix.
+#
+# Past outcomes are read from and new samples appended to a checkpoint file (see runner.py), e.g. the
+# checkpoint of a previous full run:
+#
+#   python3 adaptive.py --history results/checkpoint.jsonl --threshold 0.8
+#   python3 adaptive.py --history results/checkpoint.jsonl --top 3 --models gpt-4o-mini phi-2 gemma-7b-it
+
+import argparse
+import math
+import sys
+import threading
+import time
+import unittest
+import uuid
+from runner import (ProviderPools, end_checkpoint_line, get_version, make_entry, read_entries, run_test,
+                    write_entry)
+
+# z of the two-sided 90% interval
+Z = 1.645
+
+def wilson(passes, samples, z=Z):
+    # Wilson score interval of a pass rate
+    if not samples:
+        return 0.0, 1.0
+    rate = passes / samples
+    center = (rate + z * z / (2 * samples)) / (1 + z * z / samples)
+    spread = z * math.sqrt(rate * (1 - rate) / samples + z * z / (4 * samples * samples)) / (1 + z * z / samples)
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+def is_decided(outcomes):
+    # The majority outcome of a cell is clear if all samples agree or the interval excludes 50%
+    if len(set(outcomes)) <= 1:
+        return True
+    low, high = wilson(sum(outcomes), len(outcomes))
+    return low > 0.5 or high < 0.5
+
+def read_history(paths, versions):
+    # {(model, test): [passed, ...]} of the samples taken with the current version of the cases
+    history = {}
+    for path in paths:
+        for entry in read_entries(path):
+            if entry["test"] in versions and entry.get("version") == versions[entry["test"]]:
+                history.setdefault((entry["model"], entry["test"]), []).append(entry["outcome"] == "pass")
+    return history
+
+def correlation(xs, ys):
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    deviation = math.sqrt(sum((x - mean_x) ** 2 for x in xs) * sum((y - mean_y) ** 2 for y in ys))
+    return covariance / deviation if deviation else None
+
+def discrimination(names, history):
+    # Per case: 4p(1-p) of its pass rate p over the models, weighted with the correlation of passing
+    # it with passing the other cases. Cases that all or no models pass tell nothing about the ranking,
+    # cases without history are unknown and run first.
+    rates = {}
+    for (model, name), outcomes in history.items():
+        rates.setdefault(model, {})[name] = sum(outcomes) / len(outcomes)
+    scores = {}
+    for name in names:
+        models = [model for model in rates if name in rates[model]]
+        if not models:
+            scores[name] = math.inf
+            continue
+        case_rates = [rates[model][name] for model in models]
+        pass_rate = sum(case_rates) / len(case_rates)
+        score = 4 * pass_rate * (1 - pass_rate)
+        # Mean pass rate of every model on the other cases
+        other_rates = [[rate for other, rate in rates[model].items() if other != name] for model in models]
+        if len(models) >= 3 and all(other_rates):
+            r = correlation(case_rates, [sum(others) / len(others) for others in other_rates])
+            if r is not None:
+                score *= (1 + r) / 2
+        scores[name] = score
+    return scores
+
+def order_cases(names, history):
+    scores = discrimination(names, history)
+    return sorted(names, key=lambda name: -scores[name])
+
+class ModelState:
+    def __init__(self, model, cases):
+        self.model = model
+        self.passes = 0
+        self.evaluated = 0
+        self.remaining = cases
+        self.samples = 0
+        self.calls = 0
+        self.cost = 0.0
+        self.status = None
+
+    @property
+    def lower(self):
+        return self.passes
+
+    @property
+    def upper(self):
+        return self.passes + self.remaining
+
+def decide(states, needed=None, top=None):
+    # Stops the models whose outcome can't change anymore. The bounds only narrow, so a decision made
+    # on the bounds of the other models stays true until the end.
+    for state in states:
+        if state.status is not None:
+            continue
+        others = [other for other in states if other is not state]
+        below = needed is not None and state.upper < needed
+        outside = top is not None and sum(other.lower > state.upper for other in others) >= top
+        if below or outside:
+            state.status = "below threshold" if below else f"outside top {top}"
+        elif needed is None and top is None:
+            if not state.remaining:
+                state.status = "complete"
+        elif (needed is None or state.lower >= needed) and (top is None or sum(other.upper > state.lower for other in others) < top):
+            state.status = "qualified"
+        elif not state.remaining:
+            state.status = "complete"
+
+def estimate(state):
+    # Posterior mean and variance of the pass rate over the evaluated cases
+    alpha, beta = state.passes + 1, state.evaluated - state.passes + 1
+    mean = alpha / (alpha + beta)
+    return mean, alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1))
+
+def ranking_confidence(better, worse):
+    # Probability that the higher ranked model really passes more cases than the next one
+    if better.lower > worse.upper:
+        return 1.0
+    mean_better, variance_better = estimate(better)
+    mean_worse, variance_worse = estimate(worse)
+    z = (mean_better - mean_worse) / math.sqrt(variance_better + variance_worse)
+    return 0.5 * (1 + math.erf(z / math.sqrt(2)))
+
+def evaluate(test_class, models, history_paths, threshold=None, top=None, max_samples=5, max_workers=None,
+             stream=sys.stderr):
+    names = unittest.TestLoader().getTestCaseNames(test_class)
+    versions = {name: get_version(test_class, name) for name in names}
+    history = read_history(history_paths, versions)
+    order = order_cases(names, history)
+    needed = math.ceil(threshold * len(names) - 1e-9) if threshold is not None else None
+    states = [ModelState(model, len(names)) for model in models]
+
+    run_id = uuid.uuid4().hex[:12]
+    lock = threading.Lock()
+    checkpoint_path = history_paths[0] if history_paths else None
+    end_checkpoint_line(checkpoint_path)
+
+    def run_cell(state, name):
+        # At least one fresh sample, more while the outcome is uncertain
+        outcomes = list(history.get((state.model, name), ()))
+        for _ in range(max_samples):
+            cell_result, records, started, finished = run_test(test_class, state.model, name)
+            outcomes.append(cell_result.wasSuccessful() and not cell_result.skipped)
+            with lock:
+                state.samples += 1
+                state.calls += len(records)
+                state.cost += sum(record.get("cost_usd") or 0.0 for record in records)
+            if checkpoint_path:
+                write_entry(checkpoint_path, make_entry(state.model, name, versions[name], run_id, cell_result, finished - started), lock)
+            if is_decided(outcomes):
+                break
+        return sum(outcomes) * 2 > len(outcomes)
+
+    started = time.perf_counter()
+    with ProviderPools(max_workers) as pools:
+        for number, name in enumerate(order, 1):
+            active = [state for state in states if state.status is None]
+            if not active:
+                break
+            futures = {state: pools.submit(state.model, run_cell, state, name) for state in active}
+            for state, future in futures.items():
+                passed = future.result()
+                state.passes += passed
+                state.evaluated += 1
+                state.remaining -= 1
+            decide(states, needed, top)
+            stream.write(f"Case {number}/{len(order)} {name}: {len(active)} models, "
+                         f"{sum(state.status is None for state in states)} still running\n")
+    report(states, names, test_class, time.perf_counter() - started, stream)
+    return states
+
+def report(states, names, test_class, elapsed, stream=sys.stderr):
+    ranking = sorted(states, key=lambda state: (-estimate(state)[0], -state.upper))
+    stream.write(f"\n{'rank':>4} {'model':<45} {'passed':>9} {'bounds':>9} {'pass rate':>9} {'confidence':>10} {'samples':>7}  status\n")
+    for rank, state in enumerate(ranking, 1):
+        confidence = f"{ranking_confidence(state, ranking[rank]):.0%}" if rank < len(ranking) else "-"
+        stream.write(f"{rank:>4} {state.model:<45} {f'{state.passes}/{state.evaluated}':>9} "
+                     f"{f'{state.lower}-{state.upper}':>9} {estimate(state)[0]:>9.0%} {confidence:>10} {state.samples:>7}  {state.status}\n")
+
+    # The full matrix takes one sample per cell and one call per step of every case
+    steps = sum(len(getattr(getattr(test_class, name), "case", {}).get("steps") or [None]) for name in names)
+    full_calls = steps * len(states)
+    calls = sum(state.calls for state in states)
+    cells = sum(state.evaluated for state in states)
+    cost = sum(state.cost for state in states)
+    stream.write(f"\nEvaluated {cells} of {len(names) * len(states)} cells with {calls} calls instead of {full_calls} "
+                 f"for the full matrix ({1 - calls / full_calls if full_calls else 0:.0%} saved), ${cost:.4f} in {elapsed:.1f}s\n")
+    stream.write("Confidence: probability that the model passes more cases than the next one in the ranking\n")
+
+if __name__ == '__main__':
+    from test_api_parser import MODELS, TestApiParser
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=MODELS)
+    parser.add_argument('--history', nargs='*', default=[], help='checkpoints with past outcomes, new samples are appended to the first')
+    parser.add_argument('--threshold', type=float, help='pass rate a model has to reach, e.g. 0.8')
+    parser.add_argument('--top', type=int, help='number of leaderboard ranks to determine')
+    parser.add_argument('--max-samples', type=int, default=5, help='max. samples per cell while its outcome is uncertain')
+    parser.add_argument('--workers', type=int, help='threads per provider (default: its concurrency limit)')
+    args = parser.parse_args()
+
+    evaluate(TestApiParser, args.models, args.history, args.threshold, args.top, args.max_samples, args.workers)
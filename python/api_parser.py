@@ -1,177 +1,283 @@
-import os
-import requests
 import json
-import boto3
-from dotenv import load_dotenv
-from openai import OpenAI
-
-def analyze_with_cloudflare(url, context, prompt):
-    response = requests.post(url,
-        headers = {"Authorization": f"Bearer {os.getenv('CLOUDFLARE_TOKEN')}"},
-        json = {
-            "messages": [
-                {"role": "system", "content": context},
-                {"role": "user", "content": prompt}
-            ]
-        }
-    )
-    response_text = response.json()["result"]["response"]
+import threading
+import time
+from cache import get_cache
+from config import get_env
+from clients import get_bedrock_client, get_openai_client, get_session, get_timeouts
+from metrics import estimate_text_tokens, track_call, update_call
+from models import MODELS
+from response_parser import FIELDS, parse_response, requested_fields
+from scheduler import ProviderError, parse_retry_after, schedule
+from streaming import consume_stream
+
+def build_cloudflare_payload(spec, context, prompt):
+    if spec.template:
+        context, prompt = "", spec.template.format(context=context, prompt=prompt)
+    return {
+        **spec.params,
+        "messages": [
+            {"role": "system", "content": context},
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+def analyze_with_cloudflare(spec, context, prompt, stream=False):
+    payload = build_cloudflare_payload(spec, context, prompt)
+    if stream:
+        payload["stream"] = True
+    # The account ID is not part of the cache key so cached answers can be shared and replayed without it
+    api_base = get_env('CLOUDFLARE_API_BASE', 'https://api.cloudflare.com/client/v4')
+    url = f"{api_base}/accounts/{get_env('CLOUDFLARE_ACCOUNT_ID')}/ai/run/{spec.endpoint}"
+    return get_cache().fetch(["cloudflare", spec.endpoint, payload],
+        lambda: schedule("cloudflare", spec.endpoint, payload, lambda: request_cloudflare(url, payload, requested_fields(context))))
+
+def request_cloudflare(url, payload, fields=FIELDS):
+    import requests
+
+    # Connect time is added by the session in case a new connection has to be established
+    update_call(cached=False, connect_s=0.0)
+    started = time.perf_counter()
+    try:
+        response = get_session().post(url,
+            headers = {"Authorization": f"Bearer {get_env('CLOUDFLARE_TOKEN')}"},
+            json = payload,
+            timeout = get_timeouts(),
+            stream = payload.get("stream", False)
+        )
+        with response:
+            if response.status_code >= 400:
+                raise ProviderError("cloudflare", response.status_code, response.text[:200], parse_retry_after(response.headers.get("Retry-After")))
+            if payload.get("stream"):
+                prompt_tokens = estimate_text_tokens(json.dumps(payload, ensure_ascii=False))
+                response_text = consume_stream(iter_cloudflare_stream(response), started, fields, prompt_tokens)
+            else:
+                result = response.json()["result"]
+                usage = result.get("usage") or {}
+                update_call(ttfb_s=response.elapsed.total_seconds(), input_tokens=usage.get("prompt_tokens"), output_tokens=usage.get("completion_tokens"))
+                response_text = result["response"]
+    except requests.RequestException as e:
+        # Timeouts and connection errors
+        raise ProviderError("cloudflare", None, str(e)) from e
 
-    # Gemma returns everything with ** so remove that
-    response_text = response_text.replace('*', '')
     #print(response_text)
     return response_text
 
-def analyze_with_openai(model, context, prompt):
-    client = OpenAI(
-        api_key = os.getenv('OPENAI_API_KEY'),
-    )
-    response = client.chat.completions.create(
-            model = model,
-            temperature = 0.1,
-            max_tokens = 256,
-            messages = [
-                {"role": "system", "content": context},
-                {"role": "user", "content": prompt}
-            ]
-        )
+def iter_cloudflare_stream(response):
+    # Server-sent events, each "data:" line holds the next part of the response
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        event = json.loads(data)
+        usage = event.get("usage")
+        if usage:
+            update_call(input_tokens=usage.get("prompt_tokens"), output_tokens=usage.get("completion_tokens"))
+        yield event.get("response") or ""
+
+def build_openai_params(spec, context, prompt):
+    return {
+        "model": spec.endpoint,
+        **spec.params,
+        "messages": [
+            {"role": "system", "content": context},
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+def analyze_with_openai(spec, context, prompt, stream=False):
+    params = build_openai_params(spec, context, prompt)
+    if stream:
+        params["stream"] = True
+        params["stream_options"] = {"include_usage": True}
+    return get_cache().fetch(["openai", spec.endpoint, params],
+        lambda: schedule("openai", spec.endpoint, params, lambda: request_openai(params, requested_fields(context))))
+
+def request_openai(params, fields=FIELDS):
+    import openai
+
+    update_call(cached=False)
+    client = get_openai_client(get_env('OPENAI_API_KEY'), get_env('OPENAI_BASE_URL'))
+    started = time.perf_counter()
+    try:
+        response = client.chat.completions.create(**params)
+        if params.get("stream"):
+            try:
+                prompt_tokens = estimate_text_tokens(json.dumps(params["messages"], ensure_ascii=False))
+                return consume_stream(iter_openai_stream(response), started, fields, prompt_tokens)
+            finally:
+                response.close()
+    except openai.APIStatusError as e:
+        raise ProviderError("openai", e.status_code, e.message, parse_retry_after(e.response.headers.get("retry-after"))) from e
+    except openai.APIConnectionError as e:
+        # Timeouts and connection errors
+        raise ProviderError("openai", None, str(e)) from e
+
+    if response.usage:
+        update_call(input_tokens=response.usage.prompt_tokens, output_tokens=response.usage.completion_tokens)
 
     response_text = response.choices[0].message.content
     #print(response_text)
     return response_text
 
-def analyze_with_bedrock(model, body):
-    bedrock_runtime = boto3.client(
-        service_name='bedrock-runtime',
-        region_name='us-east-1',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'), 
-    )
+def iter_openai_stream(response):
+    for chunk in response:
+        # The usage is sent in a final chunk without choices, only if the stream is read to the end
+        if chunk.usage:
+            update_call(input_tokens=chunk.usage.prompt_tokens, output_tokens=chunk.usage.completion_tokens)
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+def build_bedrock_body(spec, context, prompt):
+    if spec.template:
+        return {"prompt": spec.template.format(context=context, prompt=prompt), **spec.params}
+    # Messages API (Claude)
+    return {
+        **spec.params,
+        "system": context,
+        "messages": [
+            {
+                "role": "user",
+                "content": [{
+                    "type": "text",
+                    "text": prompt
+                }]
+            }
+        ]
+    }
+
+def analyze_with_bedrock(spec, context, prompt, stream=False):
+    body = build_bedrock_body(spec, context, prompt)
+    key_parts = ["bedrock", spec.endpoint, body]
+    if stream:
+        key_parts.append("stream")
+    return get_cache().fetch(key_parts,
+        lambda: schedule("bedrock", spec.endpoint, body, lambda: request_bedrock(spec, json.dumps(body), stream, requested_fields(context))))
+
+def request_bedrock(spec, body, stream=False, fields=FIELDS):
+    from botocore.exceptions import BotoCoreError, ClientError
 
-    response = bedrock_runtime.invoke_model(
-        body=body,
-        modelId=model, 
-        accept="application/json", 
-        contentType="application/json"
+    update_call(cached=False)
+    bedrock_runtime = get_bedrock_client('us-east-1', get_env('AWS_ACCESS_KEY_ID'), get_env('AWS_SECRET_ACCESS_KEY'), get_env('BEDROCK_ENDPOINT_URL'))
+
+    started = time.perf_counter()
+    try:
+        if stream:
+            response = bedrock_runtime.invoke_model_with_response_stream(
+                body=body,
+                modelId=spec.endpoint,
+                accept="application/json",
+                contentType="application/json"
+            )
+            events = response['body']
+            try:
+                return consume_stream(iter_bedrock_stream(spec, events), started, fields, estimate_text_tokens(body))
+            finally:
+                events.close()
+
+        response = bedrock_runtime.invoke_model(
+            body=body,
+            modelId=spec.endpoint,
+            accept="application/json",
+            contentType="application/json"
+        )
+    except ClientError as e:
+        metadata = e.response.get("ResponseMetadata", {})
+        status = 429 if e.response.get("Error", {}).get("Code") == "ThrottlingException" else metadata.get("HTTPStatusCode")
+        raise ProviderError("bedrock", status, str(e), parse_retry_after(metadata.get("HTTPHeaders", {}).get("retry-after"))) from e
+    except BotoCoreError as e:
+        # Timeouts and connection errors
+        raise ProviderError("bedrock", None, str(e)) from e
+
+    headers = response['ResponseMetadata']['HTTPHeaders']
+    input_tokens = headers.get('x-amzn-bedrock-input-token-count')
+    output_tokens = headers.get('x-amzn-bedrock-output-token-count')
+    update_call(
+        input_tokens=int(input_tokens) if input_tokens else None,
+        output_tokens=int(output_tokens) if output_tokens else None
     )
 
     # Print response
     response_body = json.loads(response['body'].read())
-
-    if model == "mistral.mistral-large-2402-v1:0":
-        response_text = response_body["outputs"][0]["text"]
-    elif model == "anthropic.claude-3-sonnet-20240229-v1:0":
-        response_text = response_body["content"][0]["text"]
-    else:
-        ## llama2/llama3
-        response_text = response_body["generation"]
+    response_text = spec.extractor(response_body)
 
     #print(response_text)
     return response_text
-    
-
-def analyze_with_llm(model, context, prompt):
-    match model:
-        case "llama-2-7b-chat-fp16":
-            url = "https://api.cloudflare.com/client/v4/accounts/" + os.getenv('CLOUDFLARE_ACCOUNT_ID') + "/ai/run/@cf/meta/llama-2-7b-chat-fp16"
-            return analyze_with_cloudflare(url, context, prompt)
-        case "llama-3-8b-instruct":
-            url = "https://api.cloudflare.com/client/v4/accounts/" + os.getenv('CLOUDFLARE_ACCOUNT_ID') + "/ai/run/@cf/meta/llama-3-8b-instruct"
-            return analyze_with_cloudflare(url, context, prompt)
-        case "phi-2":
-            url = "https://api.cloudflare.com/client/v4/accounts/" + os.getenv('CLOUDFLARE_ACCOUNT_ID') + "/ai/run/@cf/microsoft/phi-2"
-            # Phi-2 uses a specific syntax
-            return analyze_with_cloudflare(url, "", f"[CONTEXT]{context}[/CONTEXT][PROMPT]{prompt}[/PROMPT]")
-        case "gemma-7b-it":
-            url = "https://api.cloudflare.com/client/v4/accounts/" + os.getenv('CLOUDFLARE_ACCOUNT_ID') + "/ai/run/@hf/google/gemma-7b-it"
-            # Gemma uses specific syntax
-            return analyze_with_cloudflare(url, "", f"CONTEXT:{context} PROMPT: {prompt}")
-        case "mistral-7b-instruct-v0.2":
-            url = "https://api.cloudflare.com/client/v4/accounts/" + os.getenv('CLOUDFLARE_ACCOUNT_ID') + "/ai/run/@hf/mistralai/mistral-7b-instruct-v0.2"
-            return analyze_with_cloudflare(url, context, prompt)
-        case "gpt-3.5-turbo-0125":
-            model = "gpt-3.5-turbo-0125"
-            return analyze_with_openai(model, context, prompt)
-        case "gpt-4-turbo-2024-04-09":
-            model = "gpt-4-turbo-2024-04-09"
-            return analyze_with_openai(model, context, prompt)
-        case "gpt-4o-mini":
-            model = "gpt-4o-mini"
-            return analyze_with_openai(model, context, prompt)
-        case "gpt-4o":
-            model = "gpt-4o"
-            return analyze_with_openai(model, context, prompt)
-        case "mistral.mistral-large-2402-v1:0":
-            model = "mistral.mistral-large-2402-v1:0"
-            
-            # Mistral instruct models specific syntax
-            instruction = f"<s>[INST] {context} [/INST] [QUERY] {prompt} [/QUERY]</s>"
-
-            body = json.dumps({
-                "prompt": instruction,
-                "temperature": 0.2,
-            })
-            return analyze_with_bedrock(model, body)
-        case "anthropic.claude-3-sonnet-20240229-v1:0":
-            model = "anthropic.claude-3-sonnet-20240229-v1:0"
-
-            body = json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "system": context,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [{
-                            "type": "text",
-                            "text": prompt
-                        }]
-                    }
-                ]
-            })
-
-            return analyze_with_bedrock(model, body)
-        
-        case "meta.llama2-13b-chat-v1":
-            model = "meta.llama2-13b-chat-v1"
-
-            # Llama2 instruct models specific syntax
-            instruction = f"<s>[INST] <<SYS>>{context}<</SYS>>{prompt}[/INST]"
-
-            body = json.dumps({
-                "prompt": instruction,
-                "temperature": 0.2,
-            })
-            return analyze_with_bedrock(model, body)
-        case "meta.llama2-70b-chat-v1":
-            model = "meta.llama2-70b-chat-v1"
-
-            # Llama2 instruct models specific syntax
-            instruction = f"<s>[INST] <<SYS>>{context}<</SYS>>{prompt}[/INST]"
-
-            body = json.dumps({
-                "prompt": instruction,
-                "temperature": 0.2,
-            })
-            return analyze_with_bedrock(model, body)
-        case "meta.llama3-70b-instruct-v1:0":
-            model = "meta.llama3-70b-instruct-v1:0"
-
-            # Llama3 instruct models specific syntax - follows the format of https://llama.meta.com/docs/model-cards-and-prompt-formats/meta-llama-3
-            instruction = f"<|begin_of_text|><|start_header_id|>system<|end_header_id|>{context}<|eot_id|><|start_header_id|>user<|end_header_id|>{prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>"
-
-            body = json.dumps({
-                "prompt": instruction,
-                "temperature": 0.2,
-            })
-            return analyze_with_bedrock(model, body)
-        case _:
-            print("No valid model defined")
-
-load_dotenv()
-
-# Sample call 
-# 
+
+def iter_bedrock_stream(spec, events):
+    for event in events:
+        if "chunk" not in event:
+            # Errors after the stream started are sent as events, e.g. {"throttlingException": {...}}
+            for name, error in event.items():
+                if name.endswith("Exception"):
+                    raise ProviderError("bedrock", 429 if name == "throttlingException" else 500, error.get("message", name))
+            continue
+        chunk = json.loads(event["chunk"]["bytes"])
+
+        # Claude sends the input tokens in its first chunk, Llama with every chunk along with the
+        # tokens generated so far, so they are known even if the stream is stopped early
+        if chunk.get("type") == "message_start":
+            input_tokens = (chunk.get("message") or {}).get("usage", {}).get("input_tokens")
+            if input_tokens is not None:
+                update_call(input_tokens=input_tokens)
+        if chunk.get("prompt_token_count") is not None:
+            update_call(input_tokens=chunk["prompt_token_count"])
+        if chunk.get("generation_token_count") is not None:
+            update_call(output_tokens=chunk["generation_token_count"])
+
+        # The last chunk of every model carries the token counts of the invocation
+        invocation_metrics = chunk.get("amazon-bedrock-invocationMetrics")
+        if invocation_metrics:
+            update_call(input_tokens=invocation_metrics.get("inputTokenCount"), output_tokens=invocation_metrics.get("outputTokenCount"))
+
+        yield spec.chunk_extractor(chunk)
+
+PROVIDER_ADAPTERS = {
+    "cloudflare": analyze_with_cloudflare,
+    "openai": analyze_with_openai,
+    "bedrock": analyze_with_bedrock,
+}
+
+_dispatch = None
+_dispatch_lock = threading.Lock()
+
+def get_dispatch():
+    # Model name -> (adapter, spec), resolved once on first use
+    global _dispatch
+    if _dispatch is None:
+        with _dispatch_lock:
+            if _dispatch is None:
+                _dispatch = {model: (PROVIDER_ADAPTERS[spec.provider], spec) for model, spec in MODELS.items()}
+    return _dispatch
+
+def get_provider(model):
+    spec = MODELS.get(model)
+    return spec.provider if spec else None
+
+def analyze_with_llm(model, context, prompt, stream=None):
+    entry = get_dispatch().get(model)
+    if entry is None:
+        print("No valid model defined")
+        return None
+    adapter, spec = entry
+
+    # Streaming (stops as soon as all fields are returned) can be enabled per call or via LLM_STREAMING=1
+    if stream is None:
+        stream = get_env('LLM_STREAMING', '0') == '1'
+    with track_call(spec.provider, model):
+        return adapter(spec, context, prompt, stream)
+
+def extract_with_llm(model, context, prompt, stream=None):
+    # Same as analyze_with_llm but returns the parsed and normalized fields of the response. With
+    # LLM_PRE_EXTRACT=1 the fields that can be read from the prompt by rules are filled locally first.
+    if get_env('LLM_PRE_EXTRACT', '0') == '1':
+        from pre_extract import extract_with_pre_extraction
+        return extract_with_pre_extraction(model, context, prompt, stream)
+    return parse_response(analyze_with_llm(model, context, prompt, stream))
+
+# Sample call
+#
 # context = "You are a system assistant that helps to support APIs with their correct parameters. Please extract the given location from the user input and always return it in the format LOCATION: <Location that was identified>. In case you were not able to retrieve a location return LOCATION: Unknown."
 # prompt = "I am in Romania in the town of Brasov Siebenbürgen."
 # analyze_with_llm("phi-2", context, prompt)
\ No newline at end of file
@@ -0,0 +1,388 @@
+# Offline batch mode. The requests of the test matrix (or of a production backlog) are compiled into
+# the batch request JSONL of the provider, with exactly the payloads the synchronous adapters send,
+# submitted through a backend and the result JSONL is streamed back into the response cache. The
+# tests are then evaluated by replaying the cache, backlog results are written as parsed records.
+# Batch endpoints cost about half and have much higher rate limits than synchronous calls.
+#
+#   python3 batch_api.py compile [--models gpt-4o ...] [--backlog backlog.jsonl]
+#   python3 batch_api.py submit [--local]
+#   python3 batch_api.py collect [--wait]
+#   (repeat until compile finds no more requests, for tests with several requests)
+#   LLM_CACHE_MODE=replay python3 test_api_parser.py --models gpt-4o ...
+#
+# Backends: the OpenAI Batch API, Bedrock batch inference (input and output via the S3 bucket
+# BEDROCK_BATCH_BUCKET, job role BEDROCK_BATCH_ROLE_ARN) and a local backend that fulfils batches
+# right away from the response cache or the synchronous endpoints (e.g. mock_server.py).
+#
+# The OpenAI custom IDs are the cache keys of the requests. Bedrock record IDs are 11 characters, so
+# its records are numbered per job and the manifest maps the numbers back to the cache keys. Bedrock
+# batch jobs need at least BEDROCK_BATCH_MIN_RECORDS records (default 100), smaller jobs are refused
+# on submit and can be fulfilled with --local instead.
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import unittest
+from collections import namedtuple
+from api_parser import build_bedrock_body, build_openai_params, request_bedrock, request_openai
+from cache import get_cache, make_key, set_cache
+from clients import get_aws_client, get_openai_client
+from config import get_env, load_config
+from metrics import estimate_cost, track_call
+from models import MODELS
+from response_parser import parse_response
+
+BATCH_PROVIDERS = ("openai", "bedrock")
+BATCH_DISCOUNT = 0.5
+# Minimum number of records of a Bedrock batch inference job (service quota)
+BEDROCK_MIN_RECORDS = 100
+
+BatchResult = namedtuple("BatchResult", ["custom_id", "response", "input_tokens", "output_tokens", "error"])
+
+def build_key_parts(model, context, prompt):
+    # Same payloads and cache keys as analyze_with_openai and analyze_with_bedrock without streaming
+    spec = MODELS[model]
+    if spec.provider == "openai":
+        return ["openai", spec.endpoint, build_openai_params(spec, context, prompt)]
+    if spec.provider == "bedrock":
+        return ["bedrock", spec.endpoint, build_bedrock_body(spec, context, prompt)]
+    raise ValueError(f"{spec.provider} has no batch API")
+
+def get_endpoint_model(provider, endpoint):
+    for model, spec in MODELS.items():
+        if spec.provider == provider and spec.endpoint == endpoint:
+            return model
+    raise KeyError(f"No model for {provider} endpoint {endpoint}")
+
+def to_record_id(number):
+    # Bedrock record IDs are 11 alphanumeric characters, e.g. R0000000001
+    return f"R{number:010d}"
+
+def to_batch_line(custom_id, key_parts):
+    provider, _, payload = key_parts
+    if provider == "openai":
+        return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": payload}
+    return {"recordId": custom_id, "modelInput": payload}
+
+class CollectingCache:
+    # Stands in for the response cache while the test matrix runs, records the requests that have no
+    # answer yet instead of sending them. Tests with several requests only get to their next request
+    # once the previous answers are cached, so these need another compile round after collecting.
+    mode = "collect"
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, key_parts, call):
+        key = make_key(key_parts)
+        response = self.cache.get(key)
+        if response is None and key_parts[0] in BATCH_PROVIDERS and len(key_parts) == 3:
+            with self.lock:
+                self.requests[key] = key_parts
+        return response
+
+def collect_test_requests(test_class, models):
+    previous = get_cache()
+    cache = CollectingCache(previous)
+    set_cache(cache)
+    try:
+        for model in models:
+            suite = unittest.TestSuite(test_class(name, llm=model) for name in unittest.TestLoader().getTestCaseNames(test_class))
+            suite.run(unittest.TestResult())
+    finally:
+        set_cache(previous)
+    return cache.requests
+
+def read_backlog(path):
+    # One {"id": ..., "model": ..., "context": ..., "prompt": ...} per line
+    pending, items = {}, {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            key_parts = build_key_parts(entry["model"], entry["context"], entry["prompt"])
+            custom_id = make_key(key_parts)
+            pending[custom_id] = key_parts
+            items.setdefault(custom_id, []).append(entry["id"])
+    return pending, items
+
+def compile_batches(pending, directory):
+    # One input file per model, batch jobs of both providers are limited to a single model
+    files = {}
+    for cache_key, key_parts in sorted(pending.items()):
+        provider, endpoint, _ = key_parts
+        files.setdefault((provider, endpoint), []).append((cache_key, key_parts))
+
+    os.makedirs(directory, exist_ok=True)
+    jobs = []
+    for (provider, endpoint), entries in files.items():
+        path = os.path.join(directory, f"{provider}-{re.sub(r'[^A-Za-z0-9.-]+', '-', endpoint)}.jsonl")
+        # Record ID -> cache key, the OpenAI custom IDs are the cache keys themselves
+        records = {to_record_id(number): cache_key for number, (cache_key, _) in enumerate(entries, 1)} if provider == "bedrock" else {}
+        custom_ids = list(records) or [cache_key for cache_key, _ in entries]
+        with open(path, "w", encoding="utf-8") as file:
+            for custom_id, (_, key_parts) in zip(custom_ids, entries):
+                file.write(json.dumps(to_batch_line(custom_id, key_parts), ensure_ascii=False) + "\n")
+        jobs.append({"provider": provider, "endpoint": endpoint, "path": path, "requests": len(entries),
+                     "records": records, "backend": None, "job": None, "state": "compiled"})
+    return jobs
+
+def parse_openai_result(line):
+    error = line.get("error")
+    response = line.get("response") or {}
+    if error or response.get("status_code") != 200:
+        message = (error or {}).get("message") or f"status {response.get('status_code')}"
+        return BatchResult(line["custom_id"], None, None, None, message)
+    body = response["body"]
+    usage = body.get("usage") or {}
+    return BatchResult(line["custom_id"], body["choices"][0]["message"]["content"],
+                       usage.get("prompt_tokens"), usage.get("completion_tokens"), None)
+
+def parse_bedrock_result(spec, line):
+    error = line.get("error")
+    output = line.get("modelOutput")
+    if error or output is None:
+        message = error.get("errorMessage") if isinstance(error, dict) else error
+        return BatchResult(line["recordId"], None, None, None, message or "no model output")
+    # Claude reports the usage in the body, Llama the token counts
+    usage = output.get("usage") or {}
+    return BatchResult(line["recordId"], spec.extractor(output),
+                       usage.get("input_tokens", output.get("prompt_token_count")),
+                       usage.get("output_tokens", output.get("generation_token_count")), None)
+
+class OpenAIBatchBackend:
+    def __init__(self):
+        self.client = get_openai_client(get_env('OPENAI_API_KEY'), get_env('OPENAI_BASE_URL'))
+
+    def submit(self, path, endpoint):
+        with open(path, "rb") as file:
+            uploaded = self.client.files.create(file=file, purpose="batch")
+        batch = self.client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions", completion_window="24h")
+        return {"id": batch.id}
+
+    def status(self, job):
+        batch = self.client.batches.retrieve(job["id"])
+        job["output_file_id"] = batch.output_file_id
+        job["error_file_id"] = batch.error_file_id
+        if batch.status in ("failed", "expired", "cancelled"):
+            return "failed"
+        return "completed" if batch.status == "completed" else "running"
+
+    def iter_results(self, job, endpoint):
+        # Failed requests are in a separate error file
+        for file_id in (job.get("output_file_id"), job.get("error_file_id")):
+            if file_id:
+                for line in self.client.files.content(file_id).iter_lines():
+                    if line:
+                        yield parse_openai_result(json.loads(line))
+
+class BedrockBatchBackend:
+    def __init__(self, region="us-east-1"):
+        self.bucket = get_env('BEDROCK_BATCH_BUCKET')
+        self.role_arn = get_env('BEDROCK_BATCH_ROLE_ARN')
+        if not self.bucket or not self.role_arn:
+            raise ValueError("BEDROCK_BATCH_BUCKET and BEDROCK_BATCH_ROLE_ARN are needed for Bedrock batch jobs")
+        credentials = (region, get_env('AWS_ACCESS_KEY_ID'), get_env('AWS_SECRET_ACCESS_KEY'))
+        self.s3 = get_aws_client("s3", *credentials)
+        self.bedrock = get_aws_client("bedrock", *credentials)
+
+    def submit(self, path, endpoint):
+        name = re.sub(r"[^A-Za-z0-9]+", "-", f"llm-api-parser-{int(time.time())}-{os.path.basename(path)[:-6]}")[:63]
+        key = f"input/{name}.jsonl"
+        self.s3.upload_file(path, self.bucket, key)
+        response = self.bedrock.create_model_invocation_job(
+            jobName=name,
+            roleArn=self.role_arn,
+            modelId=endpoint,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{self.bucket}/{key}"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{self.bucket}/output/"}},
+        )
+        return {"id": response["jobArn"], "input": key}
+
+    def status(self, job):
+        status = self.bedrock.get_model_invocation_job(jobIdentifier=job["id"])["status"]
+        if status in ("Failed", "Stopped", "Expired"):
+            return "failed"
+        return "completed" if status in ("Completed", "PartiallyCompleted") else "running"
+
+    def iter_results(self, job, endpoint):
+        # The output is written to <output prefix>/<job ID>/<input file name>.out
+        spec = MODELS[get_endpoint_model("bedrock", endpoint)]
+        key = f"output/{job['id'].rsplit('/', 1)[-1]}/{os.path.basename(job['input'])}.out"
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"]
+        for line in body.iter_lines():
+            if line:
+                yield parse_bedrock_result(spec, json.loads(line))
+
+class LocalBatchBackend:
+    # Fulfils a batch on submit from the response cache or, on a miss and unless the cache is in
+    # replay mode, from the synchronous endpoint. Results are written next to the input file.
+    def submit(self, path, endpoint):
+        output_path = path[:-len(".jsonl")] + ".out.jsonl"
+        with open(path, encoding="utf-8") as lines, open(output_path, "w", encoding="utf-8") as output:
+            for line in lines:
+                if line.strip():
+                    output.write(json.dumps(self.fulfil(json.loads(line), endpoint)._asdict(), ensure_ascii=False) + "\n")
+        return {"id": output_path}
+
+    def fulfil(self, line, endpoint):
+        if "custom_id" in line:
+            provider, custom_id, payload = "openai", line["custom_id"], line["body"]
+            request = lambda: request_openai(payload)
+        else:
+            provider, custom_id, payload = "bedrock", line["recordId"], line["modelInput"]
+            spec = MODELS[get_endpoint_model("bedrock", endpoint)]
+            request = lambda: request_bedrock(spec, json.dumps(payload))
+        try:
+            with track_call(provider, get_endpoint_model(provider, endpoint)) as call:
+                response = get_cache().fetch([provider, endpoint, payload], request)
+        except Exception as e:
+            return BatchResult(custom_id, None, None, None, repr(e))
+        return BatchResult(custom_id, response, call["input_tokens"], call["output_tokens"], None)
+
+    def status(self, job):
+        return "completed"
+
+    def iter_results(self, job, endpoint):
+        with open(job["id"], encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield BatchResult(**json.loads(line))
+
+BACKENDS = {
+    "openai": OpenAIBatchBackend,
+    "bedrock": BedrockBatchBackend,
+    "local": LocalBatchBackend,
+}
+
+def load_manifest(directory):
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+def check_job_sizes(manifest, local=False):
+    # Fails before anything is submitted instead of after the first jobs went out
+    if local:
+        return
+    minimum = int(get_env('BEDROCK_BATCH_MIN_RECORDS', BEDROCK_MIN_RECORDS))
+    small = [job for job in manifest["jobs"] if job["state"] == "compiled" and job["provider"] == "bedrock" and job["requests"] < minimum]
+    if small:
+        details = ", ".join(f"{job['endpoint']} ({job['requests']})" for job in small)
+        raise ValueError(f"Bedrock batch jobs need at least {minimum} records, too few for {details}. "
+                         "Add more cases or backlog entries, or fulfil them with submit --local.")
+
+def submit_jobs(manifest, local=False):
+    check_job_sizes(manifest, local)
+    for job in manifest["jobs"]:
+        if job["state"] != "compiled":
+            continue
+        job["backend"] = "local" if local else job["provider"]
+        job["job"] = BACKENDS[job["backend"]]().submit(job["path"], job["endpoint"])
+        job["state"] = "submitted"
+        print(f"Submitted {job['requests']} requests of {job['endpoint']} ({job['backend']})")
+
+def collect_results(manifest, outcomes_path=None):
+    # Streams the results of all finished jobs into the response cache and, for a backlog, writes one
+    # parsed record per backlog entry. Returns the number of jobs that are still running.
+    cache = get_cache()
+    items = manifest.get("items") or {}
+    running = 0
+    for job in manifest["jobs"]:
+        if job["state"] != "submitted":
+            continue
+        backend = BACKENDS[job["backend"]]()
+        status = backend.status(job["job"])
+        if status == "running":
+            running += 1
+            continue
+        job["state"] = status
+        if status == "failed":
+            print(f"Batch of {job['endpoint']} failed")
+            continue
+
+        model = get_endpoint_model(job["provider"], job["endpoint"])
+        records = job.get("records") or {}
+        succeeded = failed = input_tokens = output_tokens = 0
+        outcomes = open(outcomes_path, "a", encoding="utf-8") if outcomes_path and items else None
+        try:
+            for result in backend.iter_results(job["job"], job["endpoint"]):
+                cache_key = records.get(result.custom_id, result.custom_id)
+                if result.response is None:
+                    failed += 1
+                else:
+                    succeeded += 1
+                    cache.put(cache_key, result.response)
+                    input_tokens += result.input_tokens or 0
+                    output_tokens += result.output_tokens or 0
+                if outcomes:
+                    record = parse_response(result.response).as_dict()
+                    for item_id in items.get(cache_key, []):
+                        outcomes.write(json.dumps({"id": item_id, "model": model, "error": result.error, **record}, default=str) + "\n")
+        finally:
+            if outcomes:
+                outcomes.close()
+
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        cost = f"${cost * BATCH_DISCOUNT:.4f}" if cost is not None else "-"
+        print(f"{job['endpoint']}: {succeeded} succeeded, {failed} failed, {input_tokens} input/{output_tokens} output tokens, {cost}")
+    return running
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['compile', 'submit', 'collect'])
+    parser.add_argument('--dir', default='batch', help='directory of the batch files and the manifest')
+    parser.add_argument('--models', nargs='+', help='models of the test matrix (default: all with a batch API)')
+    parser.add_argument('--backlog', help='JSONL backlog with id, model, context and prompt per line instead of the test matrix')
+    parser.add_argument('--local', action='store_true', help='fulfil the batches locally from the cache or the synchronous endpoints')
+    parser.add_argument('--wait', action='store_true', help='poll until all jobs are finished')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between polls with --wait')
+    args = parser.parse_args()
+    load_config()
+
+    if args.command == 'compile':
+        if os.path.exists(os.path.join(args.dir, "manifest.json")):
+            if any(job["state"] == "submitted" for job in load_manifest(args.dir)["jobs"]):
+                parser.error("the previous batches have not been collected yet")
+        if args.backlog:
+            pending, items = read_backlog(args.backlog)
+        else:
+            from test_api_parser import MODELS as TEST_MODELS, TestApiParser
+            models = [model for model in args.models or TEST_MODELS if MODELS[model].provider in BATCH_PROVIDERS]
+            # The batch payloads are the ones of non-streamed calls
+            os.environ["LLM_STREAMING"] = "0"
+            pending, items = collect_test_requests(TestApiParser, models), {}
+        jobs = compile_batches(pending, args.dir)
+        save_manifest(args.dir, {"jobs": jobs, "items": items})
+        for job in jobs:
+            print(f"{job['path']}: {job['requests']} requests")
+    else:
+        manifest = load_manifest(args.dir)
+        if args.command == 'submit':
+            try:
+                submit_jobs(manifest, args.local)
+            except ValueError as e:
+                parser.error(str(e))
+            finally:
+                save_manifest(args.dir, manifest)
+        else:
+            while True:
+                try:
+                    running = collect_results(manifest, os.path.join(args.dir, "outcomes.jsonl"))
+                finally:
+                    save_manifest(args.dir, manifest)
+                if not running or not args.wait:
+                    break
+                time.sleep(args.interval)
+            if running:
+                print(f"{running} batches still running")
@@ -0,0 +1,141 @@
+# Batched extraction: packs several user messages into one request so the system prompt with the
+# field definitions is only sent once per batch instead of once per message. Every message is
+# delimited by a "### RECORD <n>" line which the model has to repeat in front of its answer, the
+# response is split on these lines and every part parsed on its own. Records the model skipped or
+# mangled are retried in smaller batches down to single calls.
+#
+# The batch size is chosen per model: it starts small, grows by one after every clean batch and is
+# halved after a batch with mangled records, capped by the context and output token limits.
+
+import re
+import threading
+from api_parser import extract_with_llm, get_dispatch
+from metrics import track_call
+from models import MODELS, ModelSpec
+from response_parser import FIELDS, parse_response, requested_fields
+
+BATCH_INSTRUCTIONS = """
+        You will get several user inputs, each one starts with a line "### RECORD <number>".
+        Handle every input on its own and answer all of them in the order given. Start the answer of every
+        input with its "### RECORD <number>" line followed by all fields in the format defined above."""
+
+RECORD_PATTERN = re.compile(r"^[\s#*>\[]*RECORD[\s#:]*(\d+)\b.*$", re.MULTILINE | re.IGNORECASE)
+
+def get_token_limits(model):
+    # Context window and max. output tokens of the model spec
+    spec = MODELS.get(model)
+    return spec.token_limits if spec is not None else ModelSpec._field_defaults["token_limits"]
+
+# Output tokens of one answer with all fields, with some headroom for chatty models
+RECORD_OUTPUT_TOKENS = 200
+MAX_BATCH_SIZE = 32
+
+def estimate_tokens(text):
+    # Same rough estimate as the scheduler, 4 characters per token
+    return len(text) // 4
+
+def max_batch_size(model, context, prompts):
+    context_limit, output_limit = get_token_limits(model)
+    record_tokens = max(estimate_tokens(prompt) for prompt in prompts) + RECORD_OUTPUT_TOKENS
+    available = context_limit - estimate_tokens(context + BATCH_INSTRUCTIONS)
+    return max(1, min(MAX_BATCH_SIZE, available // record_tokens, output_limit // RECORD_OUTPUT_TOKENS))
+
+class BatchSizer:
+    def __init__(self, initial=4):
+        self.size = initial
+        self.batches = 0
+        self.mangled = 0
+        self.lock = threading.Lock()
+
+    def next_size(self, limit):
+        with self.lock:
+            return max(1, min(self.size, limit))
+
+    def record(self, size, mangled):
+        # Additive increase after a clean batch, multiplicative decrease after mangled records
+        with self.lock:
+            self.batches += 1
+            self.mangled += mangled
+            if mangled:
+                self.size = max(1, size // 2)
+            elif size >= self.size:
+                self.size = min(MAX_BATCH_SIZE, size + 1)
+
+_sizers = {}
+_sizers_lock = threading.Lock()
+
+def get_sizer(model):
+    with _sizers_lock:
+        sizer = _sizers.get(model)
+        if sizer is None:
+            sizer = _sizers[model] = BatchSizer()
+        return sizer
+
+def build_batch_prompt(prompts):
+    return "\n\n".join(f"### RECORD {number}\n{prompt}" for number, prompt in enumerate(prompts, 1))
+
+def split_batch_response(text, count):
+    # Returns the answer text per record, None for records the model didn't answer
+    parts = [None] * count
+    if not text:
+        return parts
+    matches = list(RECORD_PATTERN.finditer(text))
+    for match, following in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        # The first answer wins, like for repeated fields
+        if 0 <= index < count and parts[index] is None:
+            parts[index] = text[match.end():following.start() if following else len(text)]
+    return parts
+
+def is_mangled(result, requested=FIELDS):
+    # Answers of a batch have to contain every field the context asked for, otherwise the record is
+    # retried. Values that don't parse are the model's answer and count as such, not as mangled.
+    return result is None or not result.found.issuperset(requested)
+
+def request_batch(model, context, prompts):
+    adapter, spec = get_dispatch()[model]
+    # Room for the answers of all records, Llama models on Bedrock name the parameter differently
+    limit_param = "max_gen_len" if spec.endpoint.startswith("meta.") else "max_tokens"
+    _, output_limit = get_token_limits(model)
+    spec = spec._replace(params={**spec.params, limit_param: min(output_limit, RECORD_OUTPUT_TOKENS * len(prompts))})
+    # Streaming would stop after the first complete record
+    with track_call(spec.provider, model):
+        return adapter(spec, context + BATCH_INSTRUCTIONS, build_batch_prompt(prompts), False)
+
+def extract_group(model, context, prompts):
+    # Returns the parsed records and the number of records the batch call mangled
+    if len(prompts) == 1:
+        return [extract_with_llm(model, context, prompts[0], False)], 0
+
+    parts = split_batch_response(request_batch(model, context, prompts), len(prompts))
+    results = [parse_response(part) if part is not None else None for part in parts]
+    requested = requested_fields(context)
+    mangled = [index for index, result in enumerate(results) if is_mangled(result, requested)]
+
+    # Retry the mangled records in two halves, down to single calls
+    if mangled:
+        middle = (len(mangled) + 1) // 2
+        for indexes in (mangled[:middle], mangled[middle:]):
+            if indexes:
+                retried, _ = extract_group(model, context, [prompts[index] for index in indexes])
+                for index, result in zip(indexes, retried):
+                    results[index] = result
+    return results, len(mangled)
+
+def extract_batch(model, context, prompts, batch_size=None):
+    # Batched counterpart of extract_with_llm, returns one parsed record per prompt in the same order.
+    # Without a batch_size the size is adapted per model.
+    if model not in get_dispatch():
+        print("No valid model defined")
+        return None
+    sizer = get_sizer(model)
+    limit = max_batch_size(model, context, prompts) if prompts else 1
+    results = []
+    while len(results) < len(prompts):
+        size = batch_size or sizer.next_size(limit)
+        group = prompts[len(results):len(results) + size]
+        parsed, mangled = extract_group(model, context, group)
+        if not batch_size:
+            sizer.record(len(group), mangled)
+        results.extend(parsed)
+    return results
@@ -0,0 +1,53 @@
+# Compares batched extraction (batching.py) with one call per record on the prompts of the test
+# suite: records/s, input and output tokens per record, cost per record and how many records
+# differ between both modes.
+#
+#   python3 bench_batching.py gpt-4o-mini --records 40
+#   python3 bench_batching.py gpt-4o-mini --records 40 --batch-size 10
+
+import argparse
+import time
+from api_parser import extract_with_llm
+from batching import extract_batch, get_sizer
+from cache import ResponseCache, set_cache
+from metrics import collect
+from dataset import get_steps, load_cases
+from test_api_parser import default_context
+
+def summarize(label, records, calls, seconds):
+    def total(field):
+        return sum(call[field] or 0 for call in calls)
+    costs = [call["cost_usd"] for call in calls]
+    cost = f"${sum(costs) / records * 1000:.4f}" if None not in costs else "-"
+    print(f"{label:<10} {len(calls):>6} {records / seconds:>10.2f} {total('input_tokens') / records:>14.0f} "
+          f"{total('output_tokens') / records:>15.0f} {cost:>14}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model')
+    parser.add_argument('--records', type=int, default=40)
+    parser.add_argument('--batch-size', type=int, help='fixed batch size instead of the adaptive one')
+    args = parser.parse_args()
+
+    # Always hit the provider, cached answers would hide the token usage
+    set_cache(ResponseCache(mode="off"))
+    samples = list(dict.fromkeys(step["prompt"] for case in load_cases() for step in get_steps(case)))
+    prompts = [samples[index % len(samples)] for index in range(args.records)]
+
+    print(f"{'mode':<10} {'calls':>6} {'records/s':>10} {'input tok/rec':>14} {'output tok/rec':>15} {'cost/1k rec':>14}")
+
+    with collect() as calls:
+        started = time.perf_counter()
+        single = [extract_with_llm(args.model, default_context, prompt, False) for prompt in prompts]
+        summarize("single", args.records, calls, time.perf_counter() - started)
+
+    with collect() as calls:
+        started = time.perf_counter()
+        batched = extract_batch(args.model, default_context, prompts, args.batch_size)
+        summarize("batched", args.records, calls, time.perf_counter() - started)
+
+    differing = sum(a.as_dict() != b.as_dict() for a, b in zip(single, batched))
+    sizer = get_sizer(args.model)
+    print(f"\n{differing} of {args.records} records differ between both modes")
+    if not args.batch_size:
+        print(f"adaptive batch size: {sizer.size} after {sizer.batches} batches, {sizer.mangled} mangled records")
@@ -0,0 +1,42 @@
+# Compares cold and warm per-call latency of a model to show the effect of the client pool.
+# The first call pays client creation and TLS handshake, following calls reuse the pooled client.
+# With --fresh the pool is reset before every call which mirrors per-call client construction.
+#
+#   python3 bench_clients.py gpt-3.5-turbo-0125 --calls 5
+
+import argparse
+import statistics
+import time
+from api_parser import analyze_with_llm
+from cache import ResponseCache, set_cache
+from clients import reset_clients
+
+context = "Extract the location from the user input and return it as LOCATION: <location>."
+prompt = "I am in Romania in the town of Brasov."
+
+def measure(model, calls, fresh):
+    latencies = []
+    for _ in range(calls):
+        if fresh:
+            reset_clients()
+        started = time.perf_counter()
+        analyze_with_llm(model, context, prompt)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model')
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--fresh', action='store_true', help='reset the client pool before every call')
+    args = parser.parse_args()
+
+    # Always hit the provider, a cached answer would hide the connection costs
+    set_cache(ResponseCache(mode="off"))
+    reset_clients()
+    latencies = measure(args.model, args.calls, args.fresh)
+
+    print(f"cold call:        {latencies[0] * 1000:.0f}ms")
+    if len(latencies) > 1:
+        print(f"warm calls (avg): {statistics.mean(latencies[1:]) * 1000:.0f}ms")
+        print(f"warm calls (min): {min(latencies[1:]) * 1000:.0f}ms")
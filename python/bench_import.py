@@ -0,0 +1,49 @@
+# Measures the time it takes to import api_parser in a fresh interpreter and checks that no provider
+# SDK is loaded at import time. Use --record to append the result to a JSONL file to track it over time.
+#
+#   python3 bench_import.py --runs 10 --record import_times.jsonl
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+SDK_MODULES = ("boto3", "botocore", "openai", "httpx", "requests", "dotenv")
+
+def measure_import(module):
+    # -X importtime reports the cumulative import time of every module in microseconds on stderr
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"Import time of {module} not found")
+
+def loaded_sdks(module):
+    code = f"import sys, {module}; print(','.join(m for m in {SDK_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return [name for name in result.stdout.strip().split(",") if name]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='api_parser')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--record', help='JSONL file to append the result to')
+    args = parser.parse_args()
+
+    times = [measure_import(args.module) for _ in range(args.runs)]
+    result = {
+        "timestamp": time.time(),
+        "module": args.module,
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "sdks_loaded": loaded_sdks(args.module),
+    }
+    print(f"import {args.module}: median {result['median_ms']:.1f}ms, min {result['min_ms']:.1f}ms")
+    print(f"SDKs loaded at import: {', '.join(result['sdks_loaded']) or 'none'}")
+    if args.record:
+        with open(args.record, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result) + "\n")
@@ -0,0 +1,59 @@
+# Micro-benchmark of the response parser on a large batch of synthetic model responses, compared to
+# scanning the whole response once per expected "FIELD: value" substring (no values extracted) and
+# once per field with a regex (raw values only, not normalized).
+#
+#   python3 bench_parser.py --responses 100000
+
+import argparse
+import random
+import re
+import time
+from response_parser import FIELDS, parse_response
+
+EXPECTED = ["NAME: Jan", "MAIL: jan@foo.com", "ADDRESS: Mollstrasse 1", "ZIP: 10117", "LOCATION: Berlin",
+            "COUNTRY: DE", "REQUEST: Order", "PRODUCT: Hummingbird 42", "DATE: 2026-08-12", "TIMEZONE: Europe/Berlin"]
+
+TEMPLATES = [
+    "NAME: Jan\nMAIL: jan@foo.com\nADDRESS: Mollstrasse 1\nZIP: 10117\nLOCATION: Berlin\nCOUNTRY: DE\nREQUEST: Order\n"
+    "PRODUCT: Hummingbird 42\nDATE: 2026-08-12\nGPS: 52.52,13.405\nTIMEZONE: Europe/Berlin",
+    "Here are the extracted parameters:\n\n**NAME:** Jan\n**MAIL:** jan@foo.com\n**ADDRESS:** Mollstrasse 1\n**ZIP:** 10117\n"
+    "**LOCATION:** Berlin\n**COUNTRY:** DE\n**REQUEST:** Order\n**PRODUCT:** Hummingbird 42\n**DATE:** 2026-08-12\n"
+    "**GPS:** 52.5200° N, 13.4050° E\n**TIMEZONE:** Europe/Berlin\n\nPlease let me know if you need anything else.",
+    "NAME: Jan MAIL: jan@foo.com ADDRESS: Mollstrasse 1 ZIP: 10117 LOCATION: Berlin COUNTRY: Germany REQUEST: order "
+    "PRODUCT: Hummingbird 42 DATE: 2026-08-12 GPS: Unknown TIMEZONE: Europe/Berlin",
+]
+
+FIELD_PATTERNS = [re.compile(rf"{field}:\s*(.*)", re.IGNORECASE) for field in FIELDS]
+
+def substring_scan(responses):
+    # Only answers whether the exact strings are contained, no values are extracted
+    for response in responses:
+        for expected in EXPECTED:
+            expected in response
+
+def regex_per_field(responses):
+    # Extracts the raw values by scanning the response once per field
+    for response in responses:
+        for pattern in FIELD_PATTERNS:
+            pattern.search(response)
+
+def single_pass(responses):
+    for response in responses:
+        parse_response(response)
+
+def measure(name, function, responses):
+    started = time.perf_counter()
+    function(responses)
+    elapsed = time.perf_counter() - started
+    print(f"{name:16} {len(responses) / elapsed:>12,.0f} responses/s ({elapsed:.2f}s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--responses', type=int, default=100000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    responses = [random.choice(TEMPLATES) for _ in range(args.responses)]
+    measure("substring scan", substring_scan, responses)
+    measure("regex per field", regex_per_field, responses)
+    measure("single pass", single_pass, responses)
@@ -0,0 +1,60 @@
+# Runs the test matrix with and without rule-based pre-extraction (pre_extract.py) and reports per
+# test case how many fields were filled locally, the input/output tokens and the latency saved and
+# whether the outcome changed.
+#
+#   python3 bench_pre_extract.py --models gpt-4o-mini llama-3-8b-instruct
+
+import argparse
+import io
+import os
+import tempfile
+from metrics import read_records
+from response_parser import FIELDS
+from runner import run_matrix
+from test_api_parser import MODELS, TestApiParser
+
+def run(models, pre_extract, path):
+    os.environ["LLM_PRE_EXTRACT"] = "1" if pre_extract else "0"
+    run_matrix(TestApiParser, models, results_path=path, stream=io.StringIO())
+    cells = {}
+    for record in read_records(path):
+        cell = cells.setdefault((record["model"], record["test"]), {
+            "outcome": record["outcome"], "calls": 0, "fields": 0, "input_tokens": 0, "output_tokens": 0, "total_s": 0.0})
+        cell["calls"] += 1
+        cell["fields"] += record.get("pre_extracted") or 0
+        cell["input_tokens"] += record.get("input_tokens") or 0
+        cell["output_tokens"] += record.get("output_tokens") or 0
+        cell["total_s"] += record.get("total_s") or 0.0
+    return cells
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=MODELS)
+    args = parser.parse_args()
+
+    # Always hit the provider, cached answers would hide the savings
+    os.environ["LLM_CACHE_MODE"] = "off"
+    with tempfile.TemporaryDirectory() as directory:
+        full = run(args.models, False, os.path.join(directory, "full.jsonl"))
+        pre = run(args.models, True, os.path.join(directory, "pre_extract.jsonl"))
+
+    print(f"{'model':<40} {'test':<28} {'hit rate':>8} {'input saved':>11} {'output saved':>12} {'latency saved':>13}  outcome")
+    totals = {"fields": 0, "requested": 0, "input": 0, "output": 0, "latency": 0.0}
+    for key in sorted(full.keys() & pre.keys()):
+        before, after = full[key], pre[key]
+        requested = len(FIELDS) * after["calls"]
+        hit_rate = after["fields"] / requested if requested else 0.0
+        input_saved = before["input_tokens"] - after["input_tokens"]
+        output_saved = before["output_tokens"] - after["output_tokens"]
+        latency_saved = before["total_s"] - after["total_s"]
+        outcome = before["outcome"] if before["outcome"] == after["outcome"] else f"{before['outcome']} -> {after['outcome']}"
+        print(f"{key[0]:<40} {key[1]:<28} {hit_rate:>8.0%} {input_saved:>11} {output_saved:>12} {latency_saved:>12.2f}s  {outcome}")
+        totals["fields"] += after["fields"]
+        totals["requested"] += requested
+        totals["input"] += input_saved
+        totals["output"] += output_saved
+        totals["latency"] += latency_saved
+
+    if totals["requested"]:
+        print(f"\nTotal: {totals['fields'] / totals['requested']:.0%} of the fields filled locally, {totals['input']} input "
+              f"and {totals['output']} output tokens and {totals['latency']:.1f}s of call time saved")
@@ -0,0 +1,75 @@
+# Throughput benchmark of our client stack against the local mock provider server. Drives
+# analyze_with_llm at increasing concurrency and reports calls/s, latency percentiles and our own
+# overhead on top of the simulated provider latency, to find where the stack saturates.
+#
+#   python3 bench_throughput.py --model gpt-4o --latency fixed:0.2 --calls 200
+#   python3 bench_throughput.py --base-url http://127.0.0.1:8765   # use a separately started mock_server.py
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from mock_server import MockConfig, MockProviderServer
+from models import MODELS
+from report import percentile
+
+context = "Extract the needed data from the user input."
+prompt = "I am Jan from Berlin and I'd like to order the Hummingbird 42."
+
+def run_level(model, concurrency, calls, stream):
+    from api_parser import analyze_with_llm
+
+    def call(_):
+        started = time.perf_counter()
+        analyze_with_llm(model, context, prompt, stream)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(call, range(calls)))
+    return calls / (time.perf_counter() - started), latencies
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='gpt-4o')
+    parser.add_argument('--calls', type=int, default=200, help='calls per concurrency level')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--latency', default='fixed:0.1', help='latency distribution of the in-process mock server')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--base-url', help='use an already running mock server instead of an in-process one')
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+        os.environ.update({
+            "CLOUDFLARE_API_BASE": f"{base_url}/client/v4", "OPENAI_BASE_URL": f"{base_url}/v1",
+            "BEDROCK_ENDPOINT_URL": base_url, "CLOUDFLARE_ACCOUNT_ID": "mock", "CLOUDFLARE_TOKEN": "mock",
+            "OPENAI_API_KEY": "mock", "AWS_ACCESS_KEY_ID": "mock", "AWS_SECRET_ACCESS_KEY": "mock",
+        })
+    else:
+        server = MockProviderServer(config=MockConfig(args.latency)).start()
+        os.environ.update(server.environment())
+    # Every call has to go to the server, cached answers would only measure the cache
+    os.environ["LLM_CACHE_MODE"] = "off"
+    # The client pool and the scheduler must not cap the highest level, the benchmark measures the client stack
+    os.environ["HTTP_POOL_SIZE"] = str(max(args.levels))
+    provider = MODELS[args.model].provider
+    os.environ[f"{provider.upper()}_CONCURRENCY"] = str(max(args.levels))
+
+    print(f"{'concurrency':>11} {'calls/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'overhead p50':>13}")
+    try:
+        # Warm up the client pool so the first level doesn't pay client creation
+        run_level(args.model, 1, 3, args.stream)
+        for concurrency in args.levels:
+            throughput, latencies = run_level(args.model, concurrency, args.calls, args.stream)
+            p50 = statistics.median(latencies)
+            overhead = "-"
+            if server and args.latency.startswith("fixed:"):
+                overhead = f"{(p50 - float(args.latency[6:])) * 1000:.1f}ms"
+            print(f"{concurrency:>11} {throughput:>9.1f} {p50 * 1000:>6.0f}ms {percentile(latencies, 95) * 1000:>6.0f}ms "
+                  f"{percentile(latencies, 99) * 1000:>6.0f}ms {overhead:>13}")
+    finally:
+        if server:
+            server.stop()
@@ -0,0 +1,155 @@
+# Repeated-sampling benchmark of the test matrix. Every (model, case) cell runs --runs times after a
+# warm-up, and pass rates, call latencies and costs are aggregated as they arrive into fixed-size
+# counters and histograms (metrics.Histogram), so memory doesn't grow with the number of runs and
+# --duration can be used for long soak runs. The responses are never cached.
+#
+# The summary can be stored as baseline and later runs compared against it. The exit code is 1 if the
+# p95 latency or the cost per run of a model grew or its pass rate dropped by more than the tolerance.
+#
+#   python3 benchmark.py --runs 5 --save-baseline results/baseline.json
+#   python3 benchmark.py --runs 5 --baseline results/baseline.json --latency-tolerance 0.2
+
+import argparse
+import json
+import sys
+import threading
+import time
+import unittest
+from datetime import datetime
+from adaptive import wilson
+from cache import ResponseCache, set_cache
+from metrics import FINE_LATENCY_BUCKETS, Histogram
+from runner import ProviderPools, run_test
+
+class ModelAggregate:
+    def __init__(self, names):
+        self.latency = Histogram(FINE_LATENCY_BUCKETS)
+        self.cases = {name: [0, 0] for name in names}
+        self.calls = 0
+        self.errors = 0
+        self.cost = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, name, passed, records):
+        for record in records:
+            if record.get("total_s") is not None:
+                self.latency.observe(record["total_s"])
+        with self.lock:
+            counts = self.cases[name]
+            counts[0] += passed
+            counts[1] += 1
+            self.calls += len(records)
+            self.errors += sum(1 for record in records if record.get("error"))
+            self.cost += sum(record.get("cost_usd") or 0.0 for record in records)
+
+    def summary(self, runs):
+        passes = sum(counts[0] for counts in self.cases.values())
+        samples = sum(counts[1] for counts in self.cases.values())
+        low, high = wilson(passes, samples)
+        return {
+            "pass_rate": passes / samples if samples else None,
+            "pass_rate_interval": [low, high],
+            "p50_s": self.latency.percentile(50),
+            "p95_s": self.latency.percentile(95),
+            "p99_s": self.latency.percentile(99),
+            "cost_per_run": self.cost / runs if runs else None,
+            "calls": self.calls,
+            "errors": self.errors,
+            "cases": {name: counts[0] / counts[1] for name, counts in self.cases.items() if counts[1]},
+        }
+
+def benchmark(test_class, models, runs=5, warmup=1, duration=None, max_workers=None, stream=sys.stderr):
+    # Returns ({model: summary}, runs) after `runs` runs of the matrix, or as many as fit into `duration` seconds
+    set_cache(ResponseCache(mode="off"))
+    names = unittest.TestLoader().getTestCaseNames(test_class)
+    aggregates = {model: ModelAggregate(names) for model in models}
+
+    with ProviderPools(max_workers) as pools:
+        # Warm-up calls open the connections and wake up cold models, their results are dropped
+        for _ in range(warmup):
+            for future in [pools.submit(model, run_test, test_class, model, names[0]) for model in models]:
+                future.result()
+
+        def run_cell(model, name):
+            result, records, _, _ = run_test(test_class, model, name)
+            aggregates[model].add(name, result.wasSuccessful() and not result.skipped, records)
+
+        started = time.perf_counter()
+        completed = 0
+        while completed < runs or duration is not None:
+            if duration is not None and time.perf_counter() - started >= duration:
+                break
+            for future in [pools.submit(model, run_cell, model, name) for model in models for name in names]:
+                future.result()
+            completed += 1
+            stream.write(f"Run {completed}{'' if duration is not None else f'/{runs}'} finished after "
+                         f"{time.perf_counter() - started:.1f}s\n")
+
+    return {model: aggregate.summary(completed) for model, aggregate in aggregates.items()}, completed
+
+def format_value(value, unit=""):
+    if value is None:
+        return "-"
+    return f"${value:.4f}" if unit == "$" else f"{value:.2f}{unit}"
+
+def print_summary(summary, stream=sys.stdout):
+    stream.write(f"{'model':<45} {'pass rate':>9} {'90% interval':>13} {'p50':>8} {'p95':>8} {'p99':>8} {'cost/run':>9} {'calls':>6} {'errors':>6}\n")
+    for model, s in sorted(summary.items(), key=lambda item: -(item[1]["pass_rate"] or 0)):
+        low, high = s["pass_rate_interval"]
+        stream.write(f"{model:<45} {s['pass_rate'] or 0:>9.0%} {f'{low:.0%}-{high:.0%}':>13} {format_value(s['p50_s'], 's'):>8} "
+                     f"{format_value(s['p95_s'], 's'):>8} {format_value(s['p99_s'], 's'):>8} {format_value(s['cost_per_run'], '$'):>9} "
+                     f"{s['calls']:>6} {s['errors']:>6}\n")
+
+def compare(summary, baseline, latency_tolerance=0.2, cost_tolerance=0.1, accuracy_tolerance=0.05):
+    # Returns the regressions as messages. Latency and cost tolerances are relative, the accuracy
+    # tolerance is in pass rate points.
+    regressions = []
+    for model, current in sorted(summary.items()):
+        previous = baseline["models"].get(model)
+        if previous is None:
+            continue
+        if previous["p95_s"] is not None and current["p95_s"] is None:
+            # The p95 is above the largest histogram bucket, or there were no calls at all
+            regressions.append(f"{model}: p95 latency {previous['p95_s']:.2f}s -> above {FINE_LATENCY_BUCKETS[-1]:.0f}s or unknown")
+        elif current["p95_s"] is not None and previous["p95_s"] and current["p95_s"] > previous["p95_s"] * (1 + latency_tolerance):
+            regressions.append(f"{model}: p95 latency {previous['p95_s']:.2f}s -> {current['p95_s']:.2f}s")
+        if current["cost_per_run"] is not None and previous["cost_per_run"] and current["cost_per_run"] > previous["cost_per_run"] * (1 + cost_tolerance):
+            regressions.append(f"{model}: cost per run ${previous['cost_per_run']:.4f} -> ${current['cost_per_run']:.4f}")
+        if current["pass_rate"] is not None and previous["pass_rate"] is not None and current["pass_rate"] < previous["pass_rate"] - accuracy_tolerance:
+            regressions.append(f"{model}: pass rate {previous['pass_rate']:.0%} -> {current['pass_rate']:.0%}")
+    return regressions
+
+if __name__ == '__main__':
+    from test_api_parser import MODELS, TestApiParser
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=MODELS)
+    parser.add_argument('--runs', type=int, default=5, help='runs of every (model, case) cell')
+    parser.add_argument('--warmup', type=int, default=1, help='warm-up calls per model that are not counted')
+    parser.add_argument('--duration', type=float, help='run for this many seconds instead of --runs, e.g. for soak runs')
+    parser.add_argument('--workers', type=int, help='threads per provider (default: its concurrency limit)')
+    parser.add_argument('--baseline', help='baseline JSON to compare against')
+    parser.add_argument('--save-baseline', help='write the summary as baseline JSON')
+    parser.add_argument('--latency-tolerance', type=float, default=0.2, help='allowed relative growth of the p95 latency')
+    parser.add_argument('--cost-tolerance', type=float, default=0.1, help='allowed relative growth of the cost per run')
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.05, help='allowed drop of the pass rate')
+    args = parser.parse_args()
+
+    summary, runs = benchmark(TestApiParser, args.models, args.runs, args.warmup, args.duration, args.workers)
+    print_summary(summary)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({"created_at": datetime.now().isoformat(timespec="seconds"), "runs": runs, "models": summary}, file, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(summary, baseline, args.latency_tolerance, args.cost_tolerance, args.accuracy_tolerance)
+        print(f"\nCompared with the baseline of {baseline['created_at']} ({baseline['runs']} runs)")
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
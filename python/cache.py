@@ -0,0 +1,171 @@
+# Content-addressed cache for LLM responses. The key is a hash of the provider, the model and the
+# exact payload (incl. generation parameters) that would be sent, so identical requests within or
+# across runs are only paid once.
+#
+# Modes (LLM_CACHE_MODE in .env):
+#   off        - no caching at all (default)
+#   readwrite  - serve from cache if possible, otherwise call the provider and store the answer
+#   record     - always call the provider and overwrite the cached answer
+#   replay     - only serve from cache, never call a provider (raises CacheMissError on a miss)
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from config import get_env
+
+CACHE_MODES = ("off", "readwrite", "record", "replay")
+
+class CacheMissError(LookupError):
+    pass
+
+def make_key(key_parts):
+    serialized = json.dumps(key_parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, directory=".llm_cache", mode="readwrite", memory_entries=1024,
+                 max_disk_entries=10000, max_disk_bytes=None, max_age=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode {mode}, must be one of {CACHE_MODES}")
+        self.directory = directory
+        self.mode = mode
+        self.memory_entries = memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _expired(self, created):
+        return self.max_age is not None and time.time() - created > self.max_age
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None and self.directory:
+            try:
+                with open(self._path(key), encoding="utf-8") as file:
+                    entry = json.load(file)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None or self._expired(entry["created"]):
+            return None
+        return entry["response"]
+
+    def put(self, key, response):
+        entry = {"created": time.time(), "response": response}
+        self._remember(key, entry)
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per process and thread, sharded runs may share the cache directory
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._writes_since_eviction += 1
+            evict = self._writes_since_eviction >= 100
+            if evict:
+                self._writes_since_eviction = 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        # Drop expired files first, then the oldest ones until entry count and size are within limits
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        now = time.time()
+        total_bytes = sum(size for _, size, _ in files)
+        remaining = len(files)
+        for modified, size, path in files:
+            too_old = self.max_age is not None and now - modified > self.max_age
+            too_many = self.max_disk_entries is not None and remaining > self.max_disk_entries
+            too_big = self.max_disk_bytes is not None and total_bytes > self.max_disk_bytes
+            if not (too_old or too_many or too_big):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            remaining -= 1
+            total_bytes -= size
+
+    def fetch(self, key_parts, call):
+        # Returns the cached response for the given key parts or executes call() to obtain it
+        if self.mode == "off":
+            return call()
+
+        key = make_key(key_parts)
+        if self.mode != "record":
+            response = self.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            if self.mode == "replay":
+                raise CacheMissError(f"No cached response for {key_parts[:2]} (key {key})")
+
+        self.misses += 1
+        response = call()
+        if response is not None:
+            self.put(key, response)
+        return response
+
+def cache_from_env():
+    max_bytes = get_env("LLM_CACHE_MAX_BYTES")
+    max_age = get_env("LLM_CACHE_MAX_AGE")
+    return ResponseCache(
+        directory=get_env("LLM_CACHE_DIR", ".llm_cache"),
+        mode=get_env("LLM_CACHE_MODE", "off"),
+        memory_entries=int(get_env("LLM_CACHE_MEMORY_ENTRIES", "1024")),
+        max_disk_entries=int(get_env("LLM_CACHE_MAX_ENTRIES", "10000")),
+        max_disk_bytes=int(max_bytes) if max_bytes else None,
+        max_age=float(max_age) if max_age else None,
+    )
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = cache_from_env()
+    return _cache
+
+def set_cache(cache):
+    global _cache
+    _cache = cache
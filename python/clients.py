@@ -0,0 +1,128 @@
+# Long-lived provider clients shared by all threads. Clients are created lazily on first use, once
+# per provider and credential set, so TLS handshakes and SDK bootstrap (botocore loading its service
+# models) are only paid once instead of on every request. The provider SDKs are only imported when
+# the first client of that provider is created. All clients report the time spent on connecting as
+# connect_s (0 for a reused connection) and the OpenAI and Bedrock clients the time to the response
+# headers as ttfb_s of the currently tracked call (see metrics.py and http_timing.py).
+#
+# Tunable via .env:
+#   HTTP_POOL_SIZE        - max. number of kept-alive connections per host (default 32)
+#   HTTP_CONNECT_TIMEOUT  - seconds to establish a connection (default 10)
+#   HTTP_READ_TIMEOUT     - seconds to wait for the response (default 300)
+
+import threading
+import time
+from contextvars import ContextVar
+from config import get_env
+from metrics import add_connect_time, update_call
+
+_clients = {}
+_lock = threading.Lock()
+# perf_counter() value when the latest request of the current thread was sent, the hooks of httpx
+# and botocore run in the thread that makes the call
+_sent_at = ContextVar("sent_at", default=None)
+
+def mark_sent(*args, **kwargs):
+    # Reused connections have no connect time, new ones add theirs
+    add_connect_time(0.0)
+    _sent_at.set(time.perf_counter())
+
+def mark_httpx_sent(request):
+    from http_timing import trace_httpx
+
+    request.extensions["trace"] = trace_httpx
+    mark_sent()
+
+def mark_first_byte(*args, **kwargs):
+    sent_at = _sent_at.get()
+    if sent_at is not None:
+        update_call(ttfb_s=time.perf_counter() - sent_at)
+
+def get_pool_size():
+    return int(get_env("HTTP_POOL_SIZE", "32"))
+
+def get_timeouts():
+    return float(get_env("HTTP_CONNECT_TIMEOUT", "10")), float(get_env("HTTP_READ_TIMEOUT", "300"))
+
+def get_client(key, create):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = create()
+                _clients[key] = client
+    return client
+
+def reset_clients():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close:
+            close()
+
+def create_session():
+    import requests
+    from http_timing import TimedHTTPAdapter
+
+    pool_size = get_pool_size()
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session():
+    return get_client(("http",), create_session)
+
+def get_openai_client(api_key, base_url=None):
+    def create():
+        import httpx
+        from openai import OpenAI
+
+        pool_size = get_pool_size()
+        connect_timeout, read_timeout = get_timeouts()
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            # The response hook runs once the headers arrived, before the body is read
+            event_hooks={"request": [mark_httpx_sent], "response": [mark_first_byte]},
+        )
+        # Retries are done by the scheduler
+        return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+    return get_client(("openai", api_key, base_url), create)
+
+def get_bedrock_client(region, access_key_id, secret_access_key, endpoint_url=None):
+    return get_aws_client("bedrock-runtime", region, access_key_id, secret_access_key, endpoint_url)
+
+def get_aws_client(service, region, access_key_id, secret_access_key, endpoint_url=None):
+    def create():
+        import boto3
+        from botocore.config import Config
+
+        connect_timeout, read_timeout = get_timeouts()
+        # Dedicated session per client since the boto3 default session is not thread-safe
+        session = boto3.session.Session(
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            region_name=region,
+        )
+        config = Config(
+            max_pool_connections=get_pool_size(),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            # Model invocations are retried by the scheduler, other services (S3, batch jobs) by botocore
+            retries={"total_max_attempts": 1} if service == "bedrock-runtime" else None,
+        )
+        client = session.client(service_name=service, endpoint_url=endpoint_url, config=config)
+        if service == "bedrock-runtime":
+            from http_timing import time_botocore_connections
+
+            time_botocore_connections(client)
+            # after-call runs before the body of invoke_model or the event stream is read
+            client.meta.events.register("before-send.bedrock-runtime", mark_sent)
+            client.meta.events.register("after-call.bedrock-runtime", mark_first_byte)
+        return client
+    return get_client((service, region, access_key_id, secret_access_key, endpoint_url), create)
@@ -0,0 +1,25 @@
+# Settings from the environment and the .env file. All settings are read via get_env(), which loads
+# the .env file on first use, so values from .env apply no matter which module reads them first or
+# whether it happens at import time. dotenv is only imported once a setting is actually read.
+
+import os
+import threading
+
+# .env file to load, None searches for it from this directory upwards
+ENV_FILE = None
+
+_loaded = False
+_lock = threading.Lock()
+
+def load_config():
+    global _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                from dotenv import load_dotenv
+                load_dotenv(ENV_FILE)
+                _loaded = True
+
+def get_env(name, default=None):
+    load_config()
+    return os.getenv(name, default)
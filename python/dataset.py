@@ -0,0 +1,51 @@
+# Test cases of the suite as a JSONL dataset (data/cases.jsonl), one case per line:
+#
+#   {"id": "test_info", "prompt": "...", "expect": {"mail": "jan@foo.com", "date": "2025-07-21"}, "unknown": ["request"]}
+#
+# Cases that need several calls list them as "steps", each with its own prompt, expect and unknown,
+# and an optional "context" replaces the default context. Expected values are compared like in
+# assertField: strings as case-insensitive prefix, DATE as ISO date or relative as "today+N" and GPS
+# as {"near": "<location>", "max_km": 100}. The file is read line by line, so it can grow without
+# being loaded at once. Case ids are the names of the test methods and start with "test". Another
+# dataset can be used via TEST_CASES in .env.
+
+import hashlib
+import json
+import os
+import re
+from datetime import date, timedelta
+from config import get_env
+
+DEFAULT_CASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cases.jsonl")
+RELATIVE_DATE_PATTERN = re.compile(r"^today([+-]\d+)?$")
+
+def get_cases_path():
+    return get_env("TEST_CASES", DEFAULT_CASES)
+
+def load_cases(path=None):
+    with open(path or get_cases_path(), encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if "id" not in case:
+                raise ValueError(f"Case in line {number} has no id")
+            # Test methods are only found by unittest with this prefix
+            if not case["id"].startswith("test"):
+                raise ValueError(f"Case id {case['id']} in line {number} doesn't start with 'test'")
+            yield case
+
+def get_steps(case):
+    return case.get("steps") or [case]
+
+def case_version(case):
+    # Changes whenever the case is edited, so stored results of the old version are not reused
+    return hashlib.sha256(json.dumps(case, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+def parse_expected(field, value):
+    if field == "date" and isinstance(value, str):
+        match = RELATIVE_DATE_PATTERN.match(value)
+        if match:
+            return date.today() + timedelta(days=int(match.group(1) or 0))
+        return date.fromisoformat(value)
+    return value
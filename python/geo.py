@@ -0,0 +1,231 @@
+# Offline gazetteer for the geo fields. Place names map to coordinates, country and IANA timezone, and
+# coordinates map to the nearest known place via a k-d tree, so GPS, COUNTRY and TIMEZONE can be
+# filled or validated locally instead of asking the model. The columns are kept in compact arrays.
+#
+# The bundled data/gazetteer.csv holds the test locations and larger cities. For full coverage point
+# GEO_GAZETTEER to a GeoNames cities file (e.g. cities15000.txt from https://download.geonames.org/export/dump/).
+#
+#   python3 geo.py Berlin Lençóis 52.5,13.4
+
+import argparse
+import csv
+import math
+import os
+import threading
+import time
+import unicodedata
+from array import array
+from collections import namedtuple
+from config import get_env
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+EARTH_RADIUS_KM = 6371.0
+# A place name is only resolved if the most populous place of that name is this much bigger than the next
+DOMINANCE_RATIO = 100
+
+Place = namedtuple("Place", ["name", "country", "latitude", "longitude", "timezone", "population"])
+
+def fold(name):
+    # Lookup key that ignores case and accents, e.g. "Lençóis" -> "lencois"
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    # Haversine distance
+    latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((latitude2 - latitude1) / 2) ** 2 + math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def to_vector(latitude, longitude):
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    return math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude)
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            names = [row["name"]] + [name for name in row["alternate_names"].split("|") if name]
+            yield names, row["country"], float(row["latitude"]), float(row["longitude"]), row["timezone"], int(row["population"] or 0)
+
+def read_geonames(path):
+    # Tab separated GeoNames dump, see https://download.geonames.org/export/dump/readme.txt
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            columns = line.rstrip("\n").split("\t")
+            names = [columns[1], columns[2]]
+            yield names, columns[8], float(columns[4]), float(columns[5]), columns[17], int(columns[14] or 0)
+
+class Gazetteer:
+    def __init__(self, rows):
+        self.names = []
+        self.countries = []
+        self.timezones = []
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.populations = array("q")
+        self.x = array("d")
+        self.y = array("d")
+        self.z = array("d")
+        self.by_name = {}
+        for names, country, latitude, longitude, timezone, population in rows:
+            index = len(self.names)
+            self.names.append(names[0])
+            self.countries.append(country)
+            self.timezones.append(timezone)
+            self.latitudes.append(latitude)
+            self.longitudes.append(longitude)
+            self.populations.append(population)
+            for key in {fold(name) for name in names}:
+                self.by_name.setdefault(key, []).append(index)
+            x, y, z = to_vector(latitude, longitude)
+            self.x.append(x)
+            self.y.append(y)
+            self.z.append(z)
+        # Most populous places first
+        for indexes in self.by_name.values():
+            indexes.sort(key=lambda index: -self.populations[index])
+        self.build_tree()
+
+    @classmethod
+    def load(cls, path=DEFAULT_GAZETTEER):
+        return cls(read_csv(path) if path.endswith(".csv") else read_geonames(path))
+
+    def __len__(self):
+        return len(self.names)
+
+    def place(self, index):
+        return Place(self.names[index], self.countries[index], self.latitudes[index], self.longitudes[index],
+                     self.timezones[index], self.populations[index])
+
+    def find(self, name, country=None):
+        # Most populous place of that name, optionally within the given country
+        for index in self.by_name.get(fold(name), ()):
+            if country is None or self.countries[index] == country:
+                return self.place(index)
+        return None
+
+    def resolve(self, name):
+        # Like find, but only if the name clearly refers to one place
+        indexes = self.by_name.get(fold(name), ())
+        if not indexes:
+            return None
+        if len(indexes) > 1 and self.populations[indexes[0]] < DOMINANCE_RATIO * self.populations[indexes[1]]:
+            return None
+        return self.place(indexes[0])
+
+    def build_tree(self):
+        # k-d tree over the positions as unit vectors, where the straight-line distance grows with the
+        # great-circle distance and there are no special cases at the poles or the date line. The
+        # tree is implicit: the median of every range of self.order is the node of that range.
+        coordinates = (self.x, self.y, self.z)
+        order = list(range(len(self.names)))
+        stack = [(0, len(order), 0)]
+        while stack:
+            low, high, axis = stack.pop()
+            if high - low <= 1:
+                continue
+            values = coordinates[axis]
+            order[low:high] = sorted(order[low:high], key=values.__getitem__)
+            middle = (low + high) // 2
+            stack.append((low, middle, (axis + 1) % 3))
+            stack.append((middle + 1, high, (axis + 1) % 3))
+        self.order = array("l", order)
+
+    def nearest_many(self, coordinates):
+        # Nearest place and its distance in km for each (latitude, longitude)
+        order, xs, ys, zs = self.order, self.x, self.y, self.z
+        axes = (xs, ys, zs)
+        results = []
+        for latitude, longitude in coordinates:
+            point = to_vector(latitude, longitude)
+            px, py, pz = point
+            best, best_distance = None, 5.0
+            stack = [(0, len(order), 0)]
+            while stack:
+                low, high, axis = stack.pop()
+                if low >= high:
+                    continue
+                middle = (low + high) // 2
+                index = order[middle]
+                distance = (xs[index] - px) ** 2 + (ys[index] - py) ** 2 + (zs[index] - pz) ** 2
+                if distance < best_distance:
+                    best, best_distance = index, distance
+                difference = point[axis] - axes[axis][index]
+                near, far = ((low, middle), (middle + 1, high)) if difference < 0 else ((middle + 1, high), (low, middle))
+                next_axis = (axis + 1) % 3
+                # The far side is searched after the near side, and only if it can hold a closer place
+                if difference * difference < best_distance:
+                    stack.append((*far, next_axis))
+                stack.append((*near, next_axis))
+            if best is None:
+                results.append(None)
+            else:
+                results.append((self.place(best), 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(best_distance) / 2))))
+        return results
+
+    def nearest(self, latitude, longitude):
+        return self.nearest_many([(latitude, longitude)])[0]
+
+    def find_many(self, names):
+        return [self.find(name) for name in names]
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+def get_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer.load(get_env("GEO_GAZETTEER", DEFAULT_GAZETTEER))
+    return _gazetteer
+
+def enrich(record):
+    # Fills GPS, COUNTRY and TIMEZONE of a parsed record from its location if they are missing or invalid
+    if not record.location:
+        return record
+    place = get_gazetteer().resolve(record.location)
+    if place is None:
+        return record
+    for field, value in (("GPS", (place.latitude, place.longitude)), ("COUNTRY", place.country), ("TIMEZONE", place.timezone)):
+        if getattr(record, field.lower()) is None:
+            setattr(record, field.lower(), value)
+            record.found.add(field)
+            record.invalid.discard(field)
+    return record
+
+def validate(record, max_km=100):
+    # Checks the geo fields of a parsed record against each other, returns {FIELD: bool} for the
+    # fields that could be checked
+    gazetteer = get_gazetteer()
+    place = gazetteer.resolve(record.location) if record.location else None
+    checks = {}
+    if record.gps is not None:
+        if place is not None:
+            checks["GPS"] = distance_km(*record.gps, place.latitude, place.longitude) <= max_km
+        nearest = gazetteer.nearest(*record.gps)
+        if nearest is not None and nearest[1] <= max_km:
+            place = place or nearest[0]
+    if place is not None:
+        if record.country is not None:
+            checks["COUNTRY"] = record.country == place.country
+        if record.timezone is not None:
+            checks["TIMEZONE"] = record.timezone == place.timezone
+    return checks
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('queries', nargs='+', help='place names or latitude,longitude pairs')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    gazetteer = get_gazetteer()
+    print(f"Loaded {len(gazetteer)} places in {(time.perf_counter() - started) * 1000:.1f}ms")
+    for query in args.queries:
+        started = time.perf_counter()
+        try:
+            latitude, longitude = map(float, query.split(","))
+        except ValueError:
+            result = gazetteer.find(query)
+        else:
+            result = gazetteer.nearest(latitude, longitude)
+        print(f"{query}: {result} ({(time.perf_counter() - started) * 1e6:.0f}µs)")
@@ -0,0 +1,151 @@
+# Hedged requests across models. The request is sent to the first model of an ordered list; once it
+# takes longer than the observed p95 latency of that model, the next model is asked in parallel, and
+# so on. The first response that returns all fields of the context with valid values wins and the
+# other calls are cancelled. Failed calls and incomplete records move on to the next model right away.
+#
+# Hedged calls are streamed by default since only streams can be cancelled, non-streamed losers run
+# to the end in the background and their response is dropped. The calls run in the context of the
+# caller, so their records reach the caller's collect() block (see metrics.py).
+#
+# Tunable via .env:
+#   HEDGE_DEFAULT_DELAY  - seconds before hedging while a model has too few samples (default 10)
+#   HEDGE_MIN_SAMPLES    - latencies needed before the observed p95 is used (default 20)
+#   HEDGE_WORKERS        - max. parallel hedged calls (default 32)
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from api_parser import analyze_with_llm
+from config import get_env
+from report import percentile
+from response_parser import parse_response, requested_fields
+from streaming import CallCancelledError, cancellable
+
+class LatencyEstimator:
+    # p95 over a sliding window of the latest latencies per model. Without explicit values the
+    # settings are read on every use, so changes of the environment apply to the shared estimator.
+    def __init__(self, window=200, min_samples=None, default_delay=None):
+        self.window = window
+        self._min_samples = min_samples
+        self._default_delay = default_delay
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    @property
+    def min_samples(self):
+        if self._min_samples is not None:
+            return self._min_samples
+        return int(get_env("HEDGE_MIN_SAMPLES", "20"))
+
+    @property
+    def default_delay(self):
+        if self._default_delay is not None:
+            return self._default_delay
+        return float(get_env("HEDGE_DEFAULT_DELAY", "10"))
+
+    def observe(self, model, seconds):
+        with self.lock:
+            latencies = self.latencies.get(model)
+            if latencies is None:
+                latencies = self.latencies[model] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def p95(self, model):
+        with self.lock:
+            latencies = sorted(self.latencies.get(model, ()))
+        if len(latencies) < self.min_samples:
+            return self.default_delay
+        return percentile(latencies, 95)
+
+_estimator = None
+_executor = None
+_lock = threading.Lock()
+
+def get_estimator():
+    global _estimator
+    with _lock:
+        if _estimator is None:
+            _estimator = LatencyEstimator()
+        return _estimator
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(get_env("HEDGE_WORKERS", "32")), thread_name_prefix="hedge")
+        return _executor
+
+def call_model(model, context, prompt, stream, cancel_event, estimator):
+    started = time.perf_counter()
+    try:
+        with cancellable(cancel_event):
+            response = analyze_with_llm(model, context, prompt, stream)
+    except CallCancelledError:
+        # Cancelled calls count with the time they ran so far, otherwise the slow calls that got
+        # hedged would be missing from the estimate and the p95 would shrink over time
+        estimator.observe(model, time.perf_counter() - started)
+        raise
+    estimator.observe(model, time.perf_counter() - started)
+    return response
+
+def analyze_with_hedging(models, context, prompt, stream=True):
+    # Returns (model, response) of the first complete and valid response. If no model returned one,
+    # the first response that arrived is returned, if all calls failed the last error is raised.
+    estimator = get_estimator()
+    executor = get_executor()
+    requested = requested_fields(context)
+    remaining = list(models)
+    pending = {}
+    fallback = None
+    error = None
+    hedge_at = None
+
+    def launch():
+        nonlocal hedge_at
+        model = remaining.pop(0)
+        cancel_event = threading.Event()
+        # A copy of the caller's context per call, a context can't be entered by two threads at once
+        future = executor.submit(contextvars.copy_context().run, call_model, model, context, prompt, stream, cancel_event, estimator)
+        pending[future] = (model, cancel_event)
+        hedge_at = time.perf_counter() + estimator.p95(model)
+
+    launch()
+    try:
+        while pending:
+            timeout = max(0.0, hedge_at - time.perf_counter()) if remaining else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The latest call is slower than its p95
+                launch()
+                continue
+            for future in done:
+                model, _ = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if parse_response(response).complete_for(requested):
+                    return model, response
+                if fallback is None and response is not None:
+                    fallback = model, response
+            # Nothing usable yet, ask the next model without waiting for the p95
+            if remaining:
+                launch()
+    finally:
+        for future, (_, cancel_event) in pending.items():
+            cancel_event.set()
+            future.cancel()
+
+    if fallback is not None:
+        return fallback
+    if error is not None:
+        raise error
+    return None, None
+
+def extract_with_hedging(models, context, prompt, stream=True):
+    # Same as analyze_with_hedging but returns the model and the parsed record
+    model, response = analyze_with_hedging(models, context, prompt, stream)
+    return model, parse_response(response)
@@ -0,0 +1,78 @@
+# Connections that report the time spent on TCP connect and TLS handshake to the currently tracked
+# call (see metrics.py): an HTTP adapter for requests sessions (Cloudflare), connection pools for
+# botocore clients (Bedrock) and a trace callback for httpx requests (OpenAI).
+
+import time
+from contextvars import ContextVar
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from metrics import add_connect_time
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        add_connect_time(time.perf_counter() - started)
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        add_connect_time(time.perf_counter() - started)
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+def timed_pool_classes():
+    # Same classes for botocore, whose connections add the AWS specific handling of Expect: 100-continue
+    from botocore.awsrequest import AWSHTTPConnection, AWSHTTPConnectionPool, AWSHTTPSConnection, AWSHTTPSConnectionPool
+
+    class TimedAWSHTTPConnection(AWSHTTPConnection):
+        def connect(self):
+            started = time.perf_counter()
+            super().connect()
+            add_connect_time(time.perf_counter() - started)
+
+    class TimedAWSHTTPSConnection(AWSHTTPSConnection):
+        def connect(self):
+            started = time.perf_counter()
+            super().connect()
+            add_connect_time(time.perf_counter() - started)
+
+    class TimedAWSHTTPConnectionPool(AWSHTTPConnectionPool):
+        ConnectionCls = TimedAWSHTTPConnection
+
+    class TimedAWSHTTPSConnectionPool(AWSHTTPSConnectionPool):
+        ConnectionCls = TimedAWSHTTPSConnection
+
+    return {"http": TimedAWSHTTPConnectionPool, "https": TimedAWSHTTPSConnectionPool}
+
+def time_botocore_connections(client):
+    # botocore has no connection events, its URLLib3Session gets the timed pools instead. The pools
+    # are created on the first request, so this has to run before the client is used.
+    http_session = getattr(client._endpoint, "http_session", None)
+    manager = getattr(http_session, "_manager", None)
+    if manager is None:
+        return
+    http_session._pool_classes_by_scheme = manager.pool_classes_by_scheme = timed_pool_classes()
+
+# perf_counter() value when the TCP connect or TLS handshake of the current httpx request started
+_phase_started = ContextVar("phase_started", default=None)
+
+def trace_httpx(event_name, info):
+    # httpcore trace callback, set per request via request.extensions["trace"]
+    if event_name in ("connection.connect_tcp.started", "connection.start_tls.started"):
+        _phase_started.set(time.perf_counter())
+    elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        started = _phase_started.get()
+        if started is not None:
+            add_connect_time(time.perf_counter() - started)
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
@@ -0,0 +1,174 @@
+# Per-call instrumentation. Every analyze_with_llm call emits a record with provider, model, wall time
+# (connect, time to first byte, time to first parsed field when streaming, total), token counts
+# where the provider returns them and the estimated cost. Records are collected per test so the
+# runner can attach the assertion outcome and write them to a JSONL or CSV results file (see
+# report.py for the aggregation).
+
+import bisect
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from models import MODELS
+
+RECORD_FIELDS = [
+    "run_id", "test", "outcome", "provider", "model", "started_at", "connect_s", "ttfb_s", "ttff_s", "total_s",
+    "input_tokens", "output_tokens", "cost_usd", "cached", "stopped_early", "tokens_estimated", "retries", "pre_extracted", "error",
+]
+
+_current_call = ContextVar("current_call", default=None)
+_collector = ContextVar("collector", default=None)
+_call_fields = ContextVar("call_fields", default=None)
+_write_lock = threading.Lock()
+
+def estimate_cost(model, input_tokens, output_tokens):
+    # USD per 1M input/output tokens of the model spec
+    spec = MODELS.get(model)
+    price = spec.price if spec is not None else None
+    if price is None or input_tokens is None or output_tokens is None:
+        return None
+    return (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+def update_call(**fields):
+    # Called by the provider adapters to add details to the currently tracked call
+    call = _current_call.get()
+    if call is not None:
+        call.update(fields)
+
+def estimate_text_tokens(text):
+    # Rough estimate of 4 characters per token
+    return len(text) // 4 if text else 0
+
+def fill_missing_usage(input_tokens, output_tokens):
+    # Used for streams that stopped before the provider sent the usage, the estimated values are
+    # flagged via tokens_estimated
+    call = _current_call.get()
+    if call is None:
+        return
+    for field, value in (("input_tokens", input_tokens), ("output_tokens", output_tokens)):
+        if call.get(field) is None and value is not None:
+            call[field] = value
+            call["tokens_estimated"] = True
+
+def add_connect_time(seconds):
+    call = _current_call.get()
+    if call is not None:
+        call["connect_s"] = (call.get("connect_s") or 0.0) + seconds
+
+@contextmanager
+def track_call(provider, model):
+    # Calls are considered cached until a provider adapter reports an actual request
+    call = {
+        "provider": provider, "model": model, "started_at": time.time(), "connect_s": None,
+        "ttfb_s": None, "ttff_s": None, "input_tokens": None, "output_tokens": None, "cached": True,
+        "stopped_early": False, "tokens_estimated": False, "retries": 0, "pre_extracted": 0, "error": None,
+        **(_call_fields.get() or {}),
+    }
+    token = _current_call.set(call)
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call["error"] = repr(e)
+        raise
+    finally:
+        call["total_s"] = time.perf_counter() - started
+        _current_call.reset(token)
+        call["cost_usd"] = 0.0 if call["cached"] else estimate_cost(model, call["input_tokens"], call["output_tokens"])
+        collector = _collector.get()
+        if collector is not None:
+            collector.append(call)
+
+@contextmanager
+def call_fields(**fields):
+    # Sets the given fields on all calls tracked within the block
+    token = _call_fields.set({**(_call_fields.get() or {}), **fields})
+    try:
+        yield
+    finally:
+        _call_fields.reset(token)
+
+@contextmanager
+def collect():
+    # Collects the records of all calls made within the block (in the current thread/task)
+    records = []
+    token = _collector.set(records)
+    try:
+        yield records
+    finally:
+        _collector.reset(token)
+
+def write_records(path, records):
+    with _write_lock:
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "a", newline="", encoding="utf-8") as file:
+            if path.endswith(".csv"):
+                writer = csv.DictWriter(file, fieldnames=RECORD_FIELDS, extrasaction="ignore")
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(records)
+            else:
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def read_records(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.endswith(".csv"):
+            records = []
+            for row in csv.DictReader(file):
+                for key, value in row.items():
+                    if value == "":
+                        row[key] = None
+                    elif key.endswith("_s") or key in ("started_at", "cost_usd"):
+                        row[key] = float(value)
+                    elif key.endswith("_tokens") or key in ("retries", "pre_extracted"):
+                        row[key] = int(value)
+                    elif key in ("cached", "stopped_early", "tokens_estimated"):
+                        row[key] = value == "True"
+                records.append(row)
+            return records
+        return [json.loads(line) for line in file if line.strip()]
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 5% steps from 10ms to 10min, for percentiles that are compared between benchmark runs
+FINE_LATENCY_BUCKETS = tuple(round(0.01 * 1.05 ** index, 4) for index in range(227))
+
+class Histogram:
+    # Fixed-bucket histogram for long-running processes, constant memory no matter how many values
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, p):
+        # Upper bound of the bucket that holds the p-th percentile, None for values above the last bucket
+        with self.lock:
+            rank = p / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (None,), self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return bound
+            return None
+
+    def snapshot(self):
+        # Cumulative counts per upper bound like Prometheus histograms
+        with self.lock:
+            cumulative, seen = {}, 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                cumulative[str(bound)] = seen
+            cumulative["+Inf"] = self.count
+            return {"count": self.count, "sum": self.sum, "buckets": cumulative}
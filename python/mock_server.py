@@ -0,0 +1,337 @@
+# Local stand-in for the Cloudflare, OpenAI and Bedrock APIs so api_parser can be load tested and
+# benchmarked without credentials. It speaks the wire formats used by api_parser (incl. streaming)
+# with configurable latency, error/throttle injection and canned or scripted answers.
+#
+#   python3 mock_server.py --port 8765 --latency lognormal:0.8,0.5 --throttle-rate 0.05
+#
+# Point api_parser to it via .env:
+#   CLOUDFLARE_API_BASE=http://127.0.0.1:8765/client/v4
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+#   BEDROCK_ENDPOINT_URL=http://127.0.0.1:8765
+# (plus any non-empty CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_TOKEN, OPENAI_API_KEY and AWS credentials)
+
+import argparse
+import base64
+import json
+import math
+import random
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+DEFAULT_ANSWER = """NAME: Jan
+MAIL: jan@foo.com
+ADDRESS: Mollstrasse 1
+ZIP: 10117
+LOCATION: Berlin
+COUNTRY: DE
+REQUEST: Order
+PRODUCT: Hummingbird 42
+DATE: 2026-08-12
+GPS: 52.5200,13.4050
+TIMEZONE: Europe/Berlin"""
+
+class MockConfig:
+    def __init__(self, latency="fixed:0", token_delay=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1,
+                 answers=None, default_answer=DEFAULT_ANSWER, seed=None):
+        self.latency = parse_latency(latency)
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        # Scripted answers: list of {"match": "<substring of the prompt>", "response": "<answer>"}
+        self.answers = answers or []
+        self.default_answer = default_answer
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        with self.lock:
+            return self.latency(self.random)
+
+    def sample_failure(self):
+        # Returns None, "throttle" or "error"
+        with self.lock:
+            value = self.random.random()
+        if value < self.throttle_rate:
+            return "throttle"
+        if value < self.throttle_rate + self.error_rate:
+            return "error"
+        return None
+
+    def answer(self, text):
+        for answer in self.answers:
+            if answer["match"] in text:
+                return answer["response"]
+        return self.default_answer
+
+def parse_latency(spec):
+    # "fixed:<s>", "uniform:<min>,<max>" or "lognormal:<median>,<sigma>" in seconds
+    kind, _, values = spec.partition(":")
+    numbers = [float(value) for value in values.split(",") if value]
+    match kind:
+        case "fixed":
+            return lambda rng: numbers[0]
+        case "uniform":
+            return lambda rng: rng.uniform(numbers[0], numbers[1])
+        case "lognormal":
+            return lambda rng: numbers[0] * math.exp(rng.gauss(0, numbers[1]))
+    raise ValueError(f"Invalid latency distribution {spec}")
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+def split_chunks(text, size=16):
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+def encode_event(payload):
+    # AWS event stream message as sent by invoke_model_with_response_stream
+    headers = b""
+    for name, value in ((":event-type", "chunk"), (":content-type", "application/json"), (":message-type", "event")):
+        headers += struct.pack("B", len(name)) + name.encode() + struct.pack("!BH", 7, len(value)) + value.encode()
+    body = json.dumps({"bytes": base64.b64encode(json.dumps(payload).encode()).decode()}).encode()
+    prelude = struct.pack("!II", 16 + len(headers) + len(body), len(headers))
+    message = prelude + struct.pack("!I", zlib.crc32(prelude)) + headers + body
+    return message + struct.pack("!I", zlib.crc32(message))
+
+def bedrock_family(model):
+    if model.startswith("mistral."):
+        return "mistral"
+    if model.startswith("anthropic."):
+        return "claude"
+    return "llama"
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, with Nagle's algorithm the body would wait for the
+    # delayed ACK of the headers (~40ms per call)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.loads(body or b"{}")
+        path = unquote(self.path)
+        self.server.count_request()
+
+        if "/ai/run/" in path:
+            provider = "cloudflare"
+        elif path.endswith("/chat/completions"):
+            provider = "openai"
+        elif path.startswith("/model/"):
+            provider = "bedrock"
+        else:
+            return self.send_json(404, {"error": f"Unknown path {path}"})
+
+        time.sleep(self.config.sample_latency())
+        failure = self.config.sample_failure()
+        if failure:
+            return self.send_failure(provider, failure)
+
+        if provider == "cloudflare":
+            self.handle_cloudflare(payload)
+        elif provider == "openai":
+            self.handle_openai(payload)
+        else:
+            model, _, action = path[len("/model/"):].rpartition("/")
+            self.handle_bedrock(model, payload, action == "invoke-with-response-stream")
+
+    def send_json(self, status, data, headers=None):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_failure(self, provider, failure):
+        status = 429 if failure == "throttle" else 500
+        headers = {"Retry-After": str(self.config.retry_after)} if failure == "throttle" else {}
+        message = "Too many requests" if failure == "throttle" else "Internal server error"
+        if provider == "cloudflare":
+            data = {"success": False, "errors": [{"code": status, "message": message}], "result": None}
+        elif provider == "openai":
+            data = {"error": {"message": message, "type": "rate_limit_error" if failure == "throttle" else "server_error"}}
+        else:
+            headers["x-amzn-ErrorType"] = "ThrottlingException" if failure == "throttle" else "InternalServerException"
+            data = {"message": message}
+        self.send_json(status, data, headers)
+
+    def start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+        if self.config.token_delay:
+            time.sleep(self.config.token_delay)
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def handle_cloudflare(self, payload):
+        text = "\n".join(message["content"] for message in payload.get("messages", []))
+        answer = self.config.answer(text)
+        usage = {"prompt_tokens": estimate_tokens(text), "completion_tokens": estimate_tokens(answer)}
+        if not payload.get("stream"):
+            return self.send_json(200, {"success": True, "errors": [], "result": {"response": answer, "usage": usage}})
+
+        self.start_stream("text/event-stream")
+        for part in split_chunks(answer):
+            self.write_chunk(f"data: {json.dumps({'response': part})}\n\n".encode())
+        self.write_chunk(f"data: {json.dumps({'response': '', 'usage': usage})}\n\n".encode())
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.end_stream()
+
+    def handle_openai(self, payload):
+        text = "\n".join(message["content"] for message in payload.get("messages", []))
+        answer = self.config.answer(text)
+        usage = {"prompt_tokens": estimate_tokens(text), "completion_tokens": estimate_tokens(answer)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": payload.get("model")}
+        if not payload.get("stream"):
+            return self.send_json(200, {
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            })
+
+        self.start_stream("text/event-stream")
+        for part in split_chunks(answer):
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}]}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.end_stream()
+
+    def handle_bedrock(self, model, payload, stream):
+        text = payload.get("prompt") or payload.get("system", "") + "\n" + json.dumps(payload.get("messages", []), ensure_ascii=False)
+        answer = self.config.answer(text)
+        input_tokens, output_tokens = estimate_tokens(text), estimate_tokens(answer)
+        family = bedrock_family(model)
+        if not stream:
+            if family == "mistral":
+                data = {"outputs": [{"text": answer, "stop_reason": "stop"}]}
+            elif family == "claude":
+                data = {"type": "message", "role": "assistant", "content": [{"type": "text", "text": answer}],
+                        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}}
+            else:
+                data = {"generation": answer, "prompt_token_count": input_tokens, "generation_token_count": output_tokens}
+            return self.send_json(200, data, {
+                "x-amzn-bedrock-input-token-count": str(input_tokens),
+                "x-amzn-bedrock-output-token-count": str(output_tokens),
+            })
+
+        self.start_stream("application/vnd.amazon.eventstream")
+        if family == "claude":
+            self.write_chunk(encode_event({"type": "message_start", "message": {"usage": {"input_tokens": input_tokens, "output_tokens": 1}}}))
+        generated = 0
+        for index, part in enumerate(split_chunks(answer)):
+            if family == "mistral":
+                chunk = {"outputs": [{"text": part, "stop_reason": None}]}
+            elif family == "claude":
+                chunk = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": part}}
+            else:
+                # Llama sends the prompt tokens with the first chunk and the generated tokens so far with every chunk
+                generated += estimate_tokens(part)
+                chunk = {"generation": part, "prompt_token_count": input_tokens if index == 0 else None,
+                         "generation_token_count": generated}
+            self.write_chunk(encode_event(chunk))
+        final = {"amazon-bedrock-invocationMetrics": {"inputTokenCount": input_tokens, "outputTokenCount": output_tokens}}
+        if family == "claude":
+            final["type"] = "message_stop"
+        self.write_chunk(encode_event(final))
+        self.end_stream()
+
+class MockProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Listen backlog, with the default of 5 the connections opened at once beyond it wait for the 1s SYN retry
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        super().__init__((host, port), MockHandler)
+        self.config = config or MockConfig()
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def environment(self):
+        # Variables that point api_parser to this server
+        return {
+            "CLOUDFLARE_API_BASE": f"{self.base_url}/client/v4",
+            "CLOUDFLARE_ACCOUNT_ID": "mock",
+            "CLOUDFLARE_TOKEN": "mock",
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "OPENAI_API_KEY": "mock",
+            "BEDROCK_ENDPOINT_URL": self.base_url,
+            "AWS_ACCESS_KEY_ID": "mock",
+            "AWS_SECRET_ACCESS_KEY": "mock",
+        }
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading a stream early close the connection, which is expected
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='fixed:0', help='fixed:<s>, uniform:<min>,<max> or lognormal:<median>,<sigma>')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='seconds between streamed chunks')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of requests answered with a 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After of throttled requests in seconds')
+    parser.add_argument('--answers', help='JSON file with a list of {"match": ..., "response": ...} answers')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    answers = None
+    if args.answers:
+        with open(args.answers, encoding="utf-8") as file:
+            answers = json.load(file)
+    config = MockConfig(args.latency, args.token_delay, args.error_rate, args.throttle_rate, args.retry_after, answers, seed=args.seed)
+    server = MockProviderServer(args.host, args.port, config)
+    print(f"Mock provider server listening on {server.base_url}")
+    for name, value in server.environment().items():
+        print(f"  {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
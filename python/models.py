@@ -0,0 +1,85 @@
+# Registry of all supported models. Each spec defines the provider, the provider specific model
+# endpoint/ID, the prompt template (for models that need a specific syntax instead of separate
+# system and user messages), the generation parameters, how the text is extracted from the
+# response body (Bedrock only, the other providers share one response format), the name in the
+# results table, the price in USD per 1M input/output tokens (None where pricing is not token based,
+# e.g. Cloudflare neurons) and the context window and max. output tokens.
+
+from collections import namedtuple
+
+ModelSpec = namedtuple("ModelSpec", ["provider", "endpoint", "template", "params", "extractor", "chunk_extractor",
+                                     "display_name", "price", "token_limits"],
+                       defaults=(None, {}, None, None, None, None, (4096, 1024)))
+
+PROVIDER_NAMES = {"cloudflare": "Cloudflare", "openai": "OpenAI", "bedrock": "Bedrock"}
+
+# Mistral instruct models specific syntax
+MISTRAL_TEMPLATE = "<s>[INST] {context} [/INST] [QUERY] {prompt} [/QUERY]</s>"
+# Llama2 instruct models specific syntax
+LLAMA2_TEMPLATE = "<s>[INST] <<SYS>>{context}<</SYS>>{prompt}[/INST]"
+# Llama3 instruct models specific syntax - follows the format of https://llama.meta.com/docs/model-cards-and-prompt-formats/meta-llama-3
+LLAMA3_TEMPLATE = "<|begin_of_text|><|start_header_id|>system<|end_header_id|>{context}<|eot_id|><|start_header_id|>user<|end_header_id|>{prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>"
+
+OPENAI_PARAMS = {"temperature": 0.1, "max_tokens": 256}
+BEDROCK_PROMPT_PARAMS = {"temperature": 0.2}
+CLAUDE_PARAMS = {"anthropic_version": "bedrock-2023-05-31", "max_tokens": 1000}
+
+def extract_mistral(body):
+    return body["outputs"][0]["text"]
+
+def extract_mistral_chunk(chunk):
+    outputs = chunk.get("outputs") or [{}]
+    return outputs[0].get("text") or ""
+
+def extract_claude(body):
+    return body["content"][0]["text"]
+
+def extract_claude_chunk(chunk):
+    if chunk.get("type") == "content_block_delta":
+        return chunk["delta"].get("text") or ""
+    return ""
+
+def extract_llama(body):
+    return body["generation"]
+
+def extract_llama_chunk(chunk):
+    return chunk.get("generation") or ""
+
+MODELS = {
+    "llama-2-7b-chat-fp16": ModelSpec("cloudflare", "@cf/meta/llama-2-7b-chat-fp16",
+                                      display_name="llama2 7b (fp16)", token_limits=(4096, 2048)),
+    "llama-3-8b-instruct": ModelSpec("cloudflare", "@cf/meta/llama-3-8b-instruct",
+                                     display_name="llama3 8b", token_limits=(8192, 2048)),
+    # Phi-2 uses a specific syntax
+    "phi-2": ModelSpec("cloudflare", "@cf/microsoft/phi-2", "[CONTEXT]{context}[/CONTEXT][PROMPT]{prompt}[/PROMPT]",
+                       display_name="phi-2", token_limits=(2048, 1024)),
+    # Gemma uses specific syntax
+    "gemma-7b-it": ModelSpec("cloudflare", "@hf/google/gemma-7b-it", "CONTEXT:{context} PROMPT: {prompt}",
+                             display_name="gemma-7b-it", token_limits=(8192, 2048)),
+    "mistral-7b-instruct-v0.2": ModelSpec("cloudflare", "@hf/mistralai/mistral-7b-instruct-v0.2",
+                                          display_name="mistral-7b-instruct-v0.2", token_limits=(32768, 2048)),
+    "gpt-3.5-turbo-0125": ModelSpec("openai", "gpt-3.5-turbo-0125", params=OPENAI_PARAMS,
+                                    display_name="GPT 3.5 Turbo", price=(0.50, 1.50), token_limits=(16385, 4096)),
+    "gpt-4-turbo-2024-04-09": ModelSpec("openai", "gpt-4-turbo-2024-04-09", params=OPENAI_PARAMS,
+                                        display_name="GPT 4 Turbo", price=(10.00, 30.00), token_limits=(128000, 4096)),
+    "gpt-4o-mini": ModelSpec("openai", "gpt-4o-mini", params=OPENAI_PARAMS,
+                             display_name="GPT 4o mini", price=(0.15, 0.60), token_limits=(128000, 16384)),
+    "gpt-4o": ModelSpec("openai", "gpt-4o", params=OPENAI_PARAMS,
+                        display_name="GPT 4o", price=(5.00, 15.00), token_limits=(128000, 4096)),
+    "mistral.mistral-large-2402-v1:0": ModelSpec("bedrock", "mistral.mistral-large-2402-v1:0", MISTRAL_TEMPLATE,
+                                                 BEDROCK_PROMPT_PARAMS, extract_mistral, extract_mistral_chunk,
+                                                 "Mistral Large", (8.00, 24.00), (32000, 8192)),
+    # Claude gets the context as system prompt instead of a template
+    "anthropic.claude-3-sonnet-20240229-v1:0": ModelSpec("bedrock", "anthropic.claude-3-sonnet-20240229-v1:0", None,
+                                                         CLAUDE_PARAMS, extract_claude, extract_claude_chunk,
+                                                         "Claude Sonnet", (3.00, 15.00), (200000, 4096)),
+    "meta.llama2-13b-chat-v1": ModelSpec("bedrock", "meta.llama2-13b-chat-v1", LLAMA2_TEMPLATE,
+                                         BEDROCK_PROMPT_PARAMS, extract_llama, extract_llama_chunk,
+                                         "llama2 13b", (0.75, 1.00), (4096, 2048)),
+    "meta.llama2-70b-chat-v1": ModelSpec("bedrock", "meta.llama2-70b-chat-v1", LLAMA2_TEMPLATE,
+                                         BEDROCK_PROMPT_PARAMS, extract_llama, extract_llama_chunk,
+                                         "llama2 70b", (1.95, 2.56), (4096, 2048)),
+    "meta.llama3-70b-instruct-v1:0": ModelSpec("bedrock", "meta.llama3-70b-instruct-v1:0", LLAMA3_TEMPLATE,
+                                               BEDROCK_PROMPT_PARAMS, extract_llama, extract_llama_chunk,
+                                               "llama3 70b", (2.65, 3.50), (8192, 2048)),
+}
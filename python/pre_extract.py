@@ -0,0 +1,177 @@
+# Rule-based pre-extraction of the fields that can be read mechanically from the user input: mail
+# addresses, explicit dates, zip codes, products of the product catalog and places of the gazetteer
+# (geo.py) named after a locative cue like "from" or "aus". A field is only filled if exactly one
+# unambiguous value is found, everything else (typos, relative dates, missing values that have to be
+# "Unknown") is left to the model. The model is then only asked for the remaining fields with a
+# context trimmed to their definitions, or not called at all if nothing is left. GPS, COUNTRY and TIMEZONE of a found location are taken from the gazetteer.
+# Enabled for extract_with_llm via LLM_PRE_EXTRACT=1.
+#
+# Tunable via .env:
+#   PRE_EXTRACT_PRODUCTS  - product catalog, a text file with one product name per line (default none,
+#                           PRODUCT is left to the model)
+
+import re
+import threading
+from datetime import date
+from api_parser import analyze_with_llm, get_provider
+from config import get_env
+from geo import get_gazetteer
+from metrics import call_fields, track_call, update_call
+from response_parser import CONTEXT_FIELD_PATTERN, get_context_fields, parse_response
+
+MAIL_PATTERN = re.compile(r"(?<![\w.+-])[\w.%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}\b")
+# 5 digit codes (DE, US), 6 digit codes (RO) and codes with a suffix (BR), not part of a longer number
+# or of a phone number written in groups, e.g. "030 123456" or "+49 30 123456"
+ZIP_PATTERN = re.compile(r"(?<![\d+-])(?<!\d[ /.])\d{5,6}(?:-\d{3,4})?(?![\d-])(?![ /.]\d)")
+NUMERIC_DATE_PATTERN = re.compile(r"(?<!\d)(\d{4})([-/. ])(\d{1,2})\2(\d{1,2})(?!\d)|(?<!\d)(\d{1,2})\.(\d{1,2})\.(\d{4})(?!\d)")
+
+# English, German and Romanian month names
+MONTHS = {
+    "january": 1, "januar": 1, "ianuarie": 1, "february": 2, "februar": 2, "februarie": 2,
+    "march": 3, "märz": 3, "martie": 3, "april": 4, "aprilie": 4, "may": 5, "mai": 5,
+    "june": 6, "juni": 6, "iunie": 6, "july": 7, "juli": 7, "iulie": 7, "august": 8,
+    "september": 9, "septembrie": 9, "october": 10, "oktober": 10, "octombrie": 10,
+    "november": 11, "noiembrie": 11, "december": 12, "dezember": 12, "decembrie": 12,
+}
+TEXT_DATE_PATTERN = re.compile(r"(?<!\d)(\d{1,2})(?:st|nd|rd|th|\.)?\s+(?:of\s+)?(" + "|".join(MONTHS) + r")\s+(\d{4})(?!\d)", re.IGNORECASE)
+
+# Place name candidates: up to three words that start and end with a capitalized word, e.g. "Berlin",
+# "Lençóis" or "Frankfurt am Main"
+PLACE_WORD_PATTERN = re.compile(r"[^\W\d_]+(?:[-'’][^\W\d_]+)*")
+MAX_PLACE_WORDS = 3
+# A candidate only counts as the user's location after a locative preposition (English, German,
+# Romanian, Portuguese) or a zip code, e.g. "from Berlin", "aus Berlin", "în Sinaia", "10117 Berlin".
+# Names, greetings or products that happen to be place names ("this is Santiago") are left to the model.
+LOCATIVE_CUE_PATTERN = re.compile(r"(?:\b(?:from|in|at|near|aus|bei|nach|din|în|la|em|de)|\d{4,6})\s+$", re.IGNORECASE)
+
+def to_date(year, month, day):
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+def find_dates(text):
+    # All explicit dates, None for date-like values that are not a valid date (e.g. 34th of August)
+    dates = []
+    for match in NUMERIC_DATE_PATTERN.finditer(text):
+        if match.group(1):
+            dates.append(to_date(match.group(1), match.group(3), match.group(4)))
+        else:
+            dates.append(to_date(match.group(7), match.group(6), match.group(5)))
+    for match in TEXT_DATE_PATTERN.finditer(text):
+        dates.append(to_date(match.group(3), MONTHS[match.group(2).lower()], match.group(1)))
+    return dates
+
+class ProductCatalog:
+    def __init__(self, products):
+        self.names = {product.casefold(): product for product in products}
+        # Longest names first, so "Hummingbird 42 Pro" wins over "Hummingbird 42"
+        alternatives = sorted(self.names, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(" + "|".join(map(re.escape, alternatives)) + r")\b", re.IGNORECASE) if alternatives else None
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as file:
+            return cls(line.strip() for line in file if line.strip() and not line.startswith("#"))
+
+    def find(self, text):
+        if self.pattern is None:
+            return []
+        return [self.names[match.casefold()] for match in self.pattern.findall(text)]
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog():
+    # Loaded once per path, an empty catalog without PRE_EXTRACT_PRODUCTS
+    path = get_env("PRE_EXTRACT_PRODUCTS")
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None:
+            catalog = _catalogs[path] = ProductCatalog.load(path) if path else ProductCatalog(())
+        return catalog
+
+def find_places(text):
+    # (name as written, place) of every candidate after a locative cue that the gazetteer resolves to a
+    # single place, the longest name wins, e.g. "Frankfurt am Main" over "Frankfurt"
+    gazetteer = get_gazetteer()
+    words = list(PLACE_WORD_PATTERN.finditer(text))
+    places = []
+    start = 0
+    while start < len(words):
+        found = None
+        if words[start].group()[0].isupper() and LOCATIVE_CUE_PATTERN.search(text[max(0, words[start].start() - 20):words[start].start()]):
+            for end in range(start, min(start + MAX_PLACE_WORDS, len(words))):
+                name = text[words[start].start():words[end].end()]
+                # Only words separated by single spaces or hyphens belong to one name
+                if not re.fullmatch(r"[\w'’]+(?:[ -][\w'’]+)*", name):
+                    break
+                if words[end].group()[0].isupper():
+                    place = gazetteer.resolve(name)
+                    if place is not None:
+                        found = end, name, place
+        if found:
+            end, name, place = found
+            places.append((name, place))
+            start = end + 1
+        else:
+            start += 1
+    return places
+
+def only(values):
+    # The value if all found values are the same, otherwise None
+    distinct = set(values)
+    return distinct.pop() if len(distinct) == 1 else None
+
+def pre_extract(text):
+    # Returns {FIELD: normalized value} for the fields that could be extracted confidently
+    fields = {}
+    mail = only(match.lower() for match in MAIL_PATTERN.findall(text))
+    if mail:
+        fields["MAIL"] = mail
+    dates = find_dates(text)
+    if None not in dates:
+        found_date = only(dates)
+        if found_date:
+            fields["DATE"] = found_date
+    # Digits of dates are no zip codes
+    zip_code = only(ZIP_PATTERN.findall(NUMERIC_DATE_PATTERN.sub(" ", text)))
+    if zip_code:
+        fields["ZIP"] = zip_code
+    product = only(get_catalog().find(text))
+    if product:
+        fields["PRODUCT"] = product
+    places = find_places(text)
+    place = only(place for _, place in places)
+    if place:
+        # The first spelling of the user, e.g. "München" instead of the gazetteer name "Munich"
+        fields["LOCATION"] = places[0][0]
+        fields["GPS"] = (place.latitude, place.longitude)
+        fields["COUNTRY"] = place.country
+        fields["TIMEZONE"] = place.timezone
+    return fields
+
+def trim_context(context, resolved):
+    # Removes the definitions of the resolved fields
+    return CONTEXT_FIELD_PATTERN.sub(lambda match: "" if match.group(1) in resolved else match.group(0), context)
+
+def extract_with_pre_extraction(model, context, prompt, stream=None):
+    requested = get_context_fields(context)
+    local = {field: value for field, value in pre_extract(prompt).items() if field in requested}
+    if not local or get_provider(model) is None:
+        return parse_response(analyze_with_llm(model, context, prompt, stream))
+
+    with call_fields(pre_extracted=len(local)):
+        if len(local) == len(requested):
+            # Nothing left for the model, the call is recorded without tokens
+            with track_call(get_provider(model), model):
+                update_call(cached=False, input_tokens=0, output_tokens=0)
+            record = parse_response(None)
+        else:
+            record = parse_response(analyze_with_llm(model, trim_context(context, local), prompt, stream))
+
+    for field, value in local.items():
+        setattr(record, field.lower(), value)
+        record.found.add(field)
+        record.invalid.discard(field)
+    return record
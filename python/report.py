@@ -0,0 +1,119 @@
+# Aggregates the per-call records of a results file (see metrics.py) per model and optionally
+# regenerates the results table in the README.
+#
+#   python3 test_api_parser.py --results results.jsonl
+#   python3 report.py results.jsonl --readme ../README.md
+
+import argparse
+import math
+from datetime import datetime
+from metrics import read_records
+from models import MODELS, PROVIDER_NAMES
+
+README_START = "<!-- results:start -->"
+README_END = "<!-- results:end -->"
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile on already sorted values
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def aggregate(records):
+    models = {}
+    for record in records:
+        models.setdefault(record["model"], []).append(record)
+
+    summary = {}
+    for model, model_records in models.items():
+        calls = [r for r in model_records if r.get("total_s") is not None]
+        latencies = sorted(r["total_s"] for r in calls)
+        first_fields = sorted(r["ttff_s"] for r in calls if r.get("ttff_s") is not None)
+
+        # A test counts once per run, a failure of any of its calls fails the test
+        outcomes = {}
+        for r in model_records:
+            if r.get("test"):
+                outcomes[(r.get("run_id"), r["test"])] = r.get("outcome")
+        passed = sum(1 for outcome in outcomes.values() if outcome == "pass")
+        runs = len({run_id for run_id, _ in outcomes}) or 1
+
+        # Wall time of the model within each run, from its first call started to its last call finished
+        spans = {}
+        for r in model_records:
+            first, last = spans.get(r.get("run_id"), (r["started_at"], r["started_at"]))
+            spans[r.get("run_id")] = (min(first, r["started_at"]), max(last, r["started_at"] + (r.get("total_s") or 0)))
+        wall = sum(last - first for first, last in spans.values())
+        costs = [r["cost_usd"] for r in calls if r.get("cost_usd") is not None]
+
+        summary[model] = {
+            "provider": model_records[0].get("provider"),
+            "calls": len(calls),
+            "cached": sum(1 for r in calls if r.get("cached")),
+            "errors": sum(1 for r in calls if r.get("error")),
+            "passed": passed,
+            "failed": len(outcomes) - passed,
+            "runs": runs,
+            "p50_s": percentile(latencies, 50),
+            "p95_s": percentile(latencies, 95),
+            "p99_s": percentile(latencies, 99),
+            "ttff_p50_s": percentile(first_fields, 50),
+            "wall_s": wall / len(spans),
+            "throughput": len(calls) / wall if wall > 0 else None,
+            "input_tokens": sum(r.get("input_tokens") or 0 for r in calls),
+            "output_tokens": sum(r.get("output_tokens") or 0 for r in calls),
+            "cost_usd": sum(costs) if costs else None,
+        }
+    return summary
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+def print_summary(summary):
+    print(f"{'Model':42} {'calls':>5} {'pass':>4} {'fail':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'ttff':>8} {'calls/s':>8} {'cost':>8}")
+    for model, s in sorted(summary.items(), key=lambda item: -item[1]["passed"]):
+        throughput = "-" if s["throughput"] is None else f"{s['throughput']:.2f}"
+        cost = "-" if s["cost_usd"] is None else f"${s['cost_usd']:.4f}"
+        print(f"{model:42} {s['calls']:>5} {s['passed']:>4} {s['failed']:>4} {format_seconds(s['p50_s']):>8} "
+              f"{format_seconds(s['p95_s']):>8} {format_seconds(s['p99_s']):>8} {format_seconds(s['ttff_p50_s']):>8} "
+              f"{throughput:>8} {cost:>8}")
+
+def build_table(summary, date=None):
+    tests = max((s["passed"] + s["failed"]) // s["runs"] for s in summary.values())
+    if date is None:
+        now = datetime.now()
+        date = f"{now.day} {now:%B %Y}"
+    lines = [
+        f"Last execution on {date} ({tests} tests in total).",
+        "",
+        "| Model | Provider | Tests passed | Tests failed | Execution time | p95 latency | Price/run |",
+        "| ----- | -------- | ------------ | ------------ | -------------- | ----------- | --------- |",
+    ]
+    for model, s in sorted(summary.items(), key=lambda item: (-item[1]["passed"], item[1]["wall_s"])):
+        spec = MODELS.get(model)
+        name = (spec and spec.display_name) or model
+        provider = PROVIDER_NAMES.get(s["provider"], s["provider"] or "?")
+        price = "N/A" if s["cost_usd"] is None else f"${s['cost_usd'] / s['runs']:.2f}"
+        lines.append(f"| {name} | {provider} | {s['passed'] // s['runs']} | {s['failed'] // s['runs']} | "
+                     f"{s['wall_s']:.0f}s | {format_seconds(s['p95_s'])} | {price} |")
+    return "\n".join(lines)
+
+def update_readme(path, table):
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+    start = content.index(README_START) + len(README_START)
+    end = content.index(README_END)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(content[:start] + "\n" + table + "\n" + content[end:])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('results', help='JSONL or CSV results file')
+    parser.add_argument('--readme', help='README to regenerate the results table in')
+    args = parser.parse_args()
+
+    summary = aggregate(read_records(args.results))
+    print_summary(summary)
+    if args.readme:
+        update_readme(args.readme, build_table(summary))
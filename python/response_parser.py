@@ -0,0 +1,188 @@
+# Single-pass parser that turns a model response into a typed record. All `KEY: value` pairs are
+# collected in one pass over the lines and the values are normalized, so differences in whitespace,
+# markdown formatting or casing don't cause false failures.
+
+import re
+from datetime import date
+
+FIELDS = ("NAME", "MAIL", "ADDRESS", "ZIP", "LOCATION", "COUNTRY", "REQUEST", "PRODUCT", "DATE", "GPS", "TIMEZONE")
+
+FIELD_SET = frozenset(FIELDS)
+# List markers, numbering and markdown around the keys
+KEY_STRIP = " \t>*#-.0123456789"
+
+# Upper case keys within a line, for models that return all fields in one line (e.g. "NAME: Jan MAIL: jan@foo.com")
+INLINE_KEY_PATTERN = re.compile(r"(?<=\s)\**(" + "|".join(FIELDS) + r")\**[ \t]*:")
+DATE_PATTERN = re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})")
+# Decimal degrees or degrees, minutes and seconds, e.g. "52.52" or 52°31'12"N, the seconds mark may
+# be missing at the end of the value since the quotes are stripped
+COORDINATE_PATTERN = re.compile(
+    r"(-?\d+(?:\.\d+)?)\s*°?\s*"
+    r"(?:(\d+(?:\.\d+)?)\s*['′]\s*(?:(\d+(?:\.\d+)?)(?!\s*°)\s*(?:\"|″|'')?\s*)?)?"
+    r"([NSEW])?", re.IGNORECASE)
+
+# Field definition lines of a context, e.g. "MAIL: <User e-mail address ...>"
+CONTEXT_FIELD_PATTERN = re.compile(r"^\s*(" + "|".join(FIELDS) + r")\s*:.*$\n?", re.MULTILINE)
+
+UNKNOWN_VALUES = frozenset(("unknown", "n/a", "na", "none", "null", "not provided", "not available", "-", ""))
+REQUEST_TYPES = {"order": "Order", "complaint": "Complaint", "info": "Info"}
+
+# Common non ISO-3166-1 alpha-2 answers of the models
+COUNTRY_CODES = {
+    "germany": "DE", "deutschland": "DE", "deu": "DE",
+    "brazil": "BR", "brasil": "BR", "bra": "BR",
+    "romania": "RO", "românia": "RO", "rou": "RO",
+    "united states": "US", "usa": "US",
+    "united kingdom": "GB", "uk": "GB", "gbr": "GB",
+    "france": "FR", "fra": "FR",
+    "austria": "AT", "aut": "AT",
+    "switzerland": "CH", "che": "CH",
+}
+
+class ParsedResponse:
+    __slots__ = ("name", "mail", "address", "zip", "location", "country", "request", "product", "date",
+                 "gps", "timezone", "found", "invalid")
+
+    def __init__(self):
+        for field in FIELDS:
+            setattr(self, field.lower(), None)
+        # Fields the model returned at all, and returned with a value that could not be normalized
+        self.found = set()
+        self.invalid = set()
+
+    def is_unknown(self, field):
+        # True if the model explicitly stated that it could not identify the field
+        return field.upper() in self.found and field.upper() not in self.invalid and getattr(self, field.lower()) is None
+
+    @property
+    def complete(self):
+        return len(self.found) == len(FIELDS) and not self.invalid
+
+    def complete_for(self, fields):
+        # All of the given fields were returned with a valid value or as unknown
+        return self.found.issuperset(fields) and self.invalid.isdisjoint(fields)
+
+    def as_dict(self):
+        return {field.lower(): getattr(self, field.lower()) for field in FIELDS}
+
+    def __repr__(self):
+        return f"ParsedResponse({self.as_dict()})"
+
+def get_context_fields(context):
+    return [match.group(1) for match in CONTEXT_FIELD_PATTERN.finditer(context)]
+
+def requested_fields(context):
+    # Fields an answer to the context has to contain, all fields for contexts without definitions
+    return get_context_fields(context) or FIELDS
+
+def clean(value):
+    if "*" in value or "`" in value:
+        value = value.replace("*", "").replace("`", "")
+    value = value.strip().strip("\"'")
+    return " ".join(value.split())
+
+def is_unknown_value(value):
+    # Exact placeholders and annotated ones like "Unknown (not mentioned)" or "Unknown, no product given"
+    folded = value.casefold()
+    return folded in UNKNOWN_VALUES or (folded.startswith("unknown") and folded[7:8] in " (,.;:-")
+
+def parse_date(value):
+    match = DATE_PATTERN.search(value)
+    if not match:
+        return None
+    try:
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        return None
+
+def to_degrees(degrees, minutes, seconds):
+    # Decimal degrees, None for minutes or seconds out of range
+    minutes, seconds = float(minutes or 0), float(seconds or 0)
+    if minutes >= 60 or seconds >= 60:
+        return None
+    value = abs(float(degrees)) + minutes / 60 + seconds / 3600
+    return -value if degrees.startswith("-") else value
+
+def parse_gps(value):
+    coordinates = COORDINATE_PATTERN.findall(value)
+    if len(coordinates) < 2:
+        return None
+    (*latitude, lat_hemisphere), (*longitude, lon_hemisphere) = coordinates[:2]
+    latitude, longitude = to_degrees(*latitude), to_degrees(*longitude)
+    if latitude is None or longitude is None:
+        return None
+    if lat_hemisphere.upper() == "S":
+        latitude = -abs(latitude)
+    if lon_hemisphere.upper() == "W":
+        longitude = -abs(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+def parse_country(value):
+    code = COUNTRY_CODES.get(value.casefold())
+    if code:
+        return code
+    # e.g. "DE (Germany)" or "DE - Germany"
+    token = value.split()[0].strip("(),.-")
+    if len(token) == 2 and token.isalpha():
+        return token.upper()
+    return COUNTRY_CODES.get(token.casefold())
+
+def normalize(field, value):
+    match field:
+        case "MAIL":
+            return value.strip("<>").lower().removeprefix("mailto:")
+        case "DATE":
+            return parse_date(value)
+        case "GPS":
+            return parse_gps(value)
+        case "COUNTRY":
+            return parse_country(value)
+        case "REQUEST":
+            # Other wordings are kept as they are, e.g. "Order request"
+            return REQUEST_TYPES.get(value.casefold().rstrip("."), value)
+        case "TIMEZONE":
+            return value.split()[0]
+        case _:
+            return value
+
+def iter_fields(text):
+    # Yields (FIELD, raw value) for every line starting with a key in any casing, optionally with
+    # list markers and markdown bold, e.g. "1. **Name:** Jan"
+    for line in text.split("\n"):
+        key, separator, value = line.partition(":")
+        if not separator:
+            continue
+        field = key.strip(KEY_STRIP).upper()
+        if field not in FIELD_SET:
+            continue
+        if ":" not in value:
+            yield field, value
+            continue
+
+        # Further keys within the same line end the value
+        position = 0
+        for match in INLINE_KEY_PATTERN.finditer(value):
+            yield field, value[position:match.start()]
+            field, position = match.group(1), match.end()
+        yield field, value[position:]
+
+def parse_response(text):
+    record = ParsedResponse()
+    if not text:
+        return record
+    found = record.found
+    for field, value in iter_fields(text):
+        # The first occurrence wins, models sometimes repeat the fields in a summary
+        if field in found:
+            continue
+        found.add(field)
+        value = clean(value)
+        if is_unknown_value(value):
+            continue
+        normalized = normalize(field, value)
+        if normalized is None:
+            record.invalid.add(field)
+        setattr(record, field.lower(), normalized)
+    return record
@@ -0,0 +1,243 @@
+# Runs a test case class against many models at once. Every (model, test) pair is executed
+# in a shared thread pool since nearly all of the time is spent waiting on the providers.
+#
+# With a checkpoint file the outcome of every cell is appended as soon as it finished, and cells that
+# already passed or failed with the same version of the test case are skipped on the next run. Only
+# missing cells and errors (e.g. throttling or a crash) are run again, so adding a model or a case
+# only costs the new cells. The matrix can be split into shards for several processes or machines,
+# each with its own checkpoint, and the checkpoints merged afterwards:
+#
+#   python3 test_api_parser.py --checkpoint results/shard-1.jsonl --shard 1/3
+#   python3 runner.py merge results/checkpoint.jsonl results/shard-*.jsonl
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from api_parser import get_provider
+from dataset import case_version
+from metrics import collect, write_records
+from scheduler import DEFAULT_CONCURRENCY, get_scheduler
+
+def get_provider_limits():
+    # Max. parallel requests per provider as enforced by the scheduler, e.g. CLOUDFLARE_CONCURRENCY=2 in .env
+    return {provider: get_scheduler(provider).max_in_flight for provider in DEFAULT_CONCURRENCY}
+
+class ProviderPools:
+    # One thread pool per provider sized to its limit, so cells waiting for a busy provider never hold
+    # up the cells of the other providers and all providers run side by side. max_workers overrides
+    # the size of every pool.
+    def __init__(self, max_workers=None):
+        limits = get_provider_limits()
+        self.executors = {provider: ThreadPoolExecutor(max_workers=max_workers or limit, thread_name_prefix=provider)
+                          for provider, limit in limits.items()}
+        # Models without a known provider fail right away
+        self.default = ThreadPoolExecutor(max_workers=max_workers or 1)
+
+    def submit(self, model, fn, *args):
+        return self.executors.get(get_provider(model), self.default).submit(fn, *args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for executor in (*self.executors.values(), self.default):
+            executor.shutdown()
+
+def merge_result(target, source):
+    target.failures.extend(source.failures)
+    target.errors.extend(source.errors)
+    target.skipped.extend(source.skipped)
+    target.expectedFailures.extend(source.expectedFailures)
+    target.unexpectedSuccesses.extend(source.unexpectedSuccesses)
+    target.testsRun += source.testsRun
+
+def print_summary(model, result, elapsed, stream=sys.stderr):
+    stream.write(f"\nResults for configuration: {model}\n")
+    result.printErrors()
+    failed = len(result.failures) + len(result.errors)
+    stream.write(f"Ran {result.testsRun} tests in {elapsed:.3f}s\n")
+    if failed:
+        stream.write(f"FAILED (passed={result.testsRun - failed}, failures={len(result.failures)}, errors={len(result.errors)})\n")
+    else:
+        stream.write("OK\n")
+
+def get_outcome(result):
+    if result.errors:
+        return "error"
+    if result.failures:
+        return "fail"
+    if result.skipped:
+        return "skip"
+    return "pass"
+
+def get_message(result):
+    # Last line of the first failure or error, e.g. "AssertionError: DATE not found ..."
+    for _, text in result.errors + result.failures:
+        return text.strip().splitlines()[-1][:500]
+    return None
+
+def parse_shard(value):
+    # "2/4" -> (1, 4), the second of four shards
+    index, count = map(int, value.split("/"))
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {value}")
+    return index - 1, count
+
+def in_shard(model, name, shard):
+    # Stable across processes and machines, unlike hash()
+    index, count = shard
+    return zlib.crc32(f"{model}\t{name}".encode("utf-8")) % count == index
+
+def get_version(test_class, name):
+    # Version of the dataset case behind a test method, None for plain test methods
+    case = getattr(getattr(test_class, name), "case", None)
+    return case_version(case) if case is not None else None
+
+def read_entries(path):
+    # All entries of a checkpoint in the order they were written
+    if not path or not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Line cut off by a crash while writing, the cell runs again
+                continue
+
+def read_checkpoint(path):
+    # Latest entry per (model, test)
+    cells = {}
+    for entry in read_entries(path):
+        key = (entry["model"], entry["test"])
+        if key not in cells or entry["finished_at"] >= cells[key]["finished_at"]:
+            cells[key] = entry
+    return cells
+
+def make_entry(model, name, version, run_id, result, duration):
+    return {
+        "model": model, "test": name, "version": version, "outcome": get_outcome(result), "run_id": run_id,
+        "finished_at": time.time(), "duration_s": round(duration, 3), "message": get_message(result),
+    }
+
+def write_entry(path, entry, lock):
+    with lock, open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def run_test(test_class, model, name):
+    # Runs one (model, test) cell, returns its unittest result, the recorded calls and the start and end time.
+    # The parallel requests per provider are limited by the scheduler.
+    test = test_class(name, llm=model)
+    cell_result = unittest.TestResult()
+    with collect() as records:
+        started = time.perf_counter()
+        test.run(cell_result)
+        finished = time.perf_counter()
+    return cell_result, records, started, finished
+
+def end_checkpoint_line(path):
+    # Terminates a line cut off by a crash, so the next entry starts on a line of its own
+    if path and os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb+") as file:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                file.write(b"\n")
+
+def is_done(entry, version, rerun_failures=False):
+    if entry is None or entry.get("version") != version:
+        return False
+    return entry["outcome"] == "pass" or (entry["outcome"] in ("fail", "skip") and not rerun_failures)
+
+def merge_checkpoints(target, paths):
+    cells = {}
+    for path in paths:
+        for key, entry in read_checkpoint(path).items():
+            if key not in cells or entry["finished_at"] >= cells[key]["finished_at"]:
+                cells[key] = entry
+    with open(target, "w", encoding="utf-8") as file:
+        for key in sorted(cells):
+            file.write(json.dumps(cells[key], ensure_ascii=False) + "\n")
+    return cells
+
+def print_checkpoint_summary(cells, stream=sys.stderr):
+    outcomes = {}
+    for (model, _), entry in cells.items():
+        counts = outcomes.setdefault(model, {})
+        counts[entry["outcome"]] = counts.get(entry["outcome"], 0) + 1
+    stream.write(f"\n{'model':<45} {'pass':>5} {'fail':>5} {'error':>5} {'skip':>5}\n")
+    for model in sorted(outcomes):
+        counts = outcomes[model]
+        stream.write(f"{model:<45} {counts.get('pass', 0):>5} {counts.get('fail', 0):>5} {counts.get('error', 0):>5} {counts.get('skip', 0):>5}\n")
+
+def run_matrix(test_class, models, max_workers=None, results_path=None, stream=sys.stderr,
+               checkpoint_path=None, shard=None, rerun_failures=False):
+    names = unittest.TestLoader().getTestCaseNames(test_class)
+    versions = {name: get_version(test_class, name) for name in names}
+    checkpoint = read_checkpoint(checkpoint_path)
+    cells = [(model, name) for model in models for name in names if shard is None or in_shard(model, name, shard)]
+    todo = [(model, name) for model, name in cells if not is_done(checkpoint.get((model, name)), versions[name], rerun_failures)]
+    if checkpoint_path:
+        end_checkpoint_line(checkpoint_path)
+        stream.write(f"{len(cells) - len(todo)} of {len(cells)} cells already done, running {len(todo)}\n")
+
+    run_id = uuid.uuid4().hex[:12]
+    results = {}
+    timings = {}
+    lock = threading.Lock()
+    for model in models:
+        results[model] = unittest.TextTestResult(unittest.runner._WritelnDecorator(stream), True, 0)
+        timings[model] = [None, None]
+
+    def run_cell(model, name):
+        cell_result, records, started, finished = run_test(test_class, model, name)
+        outcome = get_outcome(cell_result)
+        if checkpoint_path:
+            write_entry(checkpoint_path, make_entry(model, name, versions[name], run_id, cell_result, finished - started), lock)
+        if results_path:
+            # Keep a record of the test even if it failed before calling the model
+            records = records or [{"provider": get_provider(model), "model": model, "started_at": time.time()}]
+            for record in records:
+                record.update(run_id=run_id, test=name, outcome=outcome)
+            write_records(results_path, records)
+        with lock:
+            merge_result(results[model], cell_result)
+            first, last = timings[model]
+            timings[model] = [started if first is None else min(first, started), max(last or finished, finished)]
+
+    started = time.perf_counter()
+    with ProviderPools(max_workers) as pools:
+        futures = [pools.submit(model, run_cell, model, name) for model, name in todo]
+        for future in futures:
+            future.result()
+
+    for model in models:
+        first, last = timings[model]
+        print_summary(model, results[model], (last - first) if first is not None else 0.0, stream)
+    stream.write(f"\nTotal wall time for {len(models)} models: {time.perf_counter() - started:.1f}s\n")
+    if checkpoint_path:
+        print_checkpoint_summary(read_checkpoint(checkpoint_path), stream)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge = subparsers.add_parser('merge', help='merge the checkpoints of several shards')
+    merge.add_argument('target', help='merged checkpoint to write')
+    merge.add_argument('checkpoints', nargs='+', help='checkpoints of the shards')
+    summary = subparsers.add_parser('summary', help='outcomes per model of a checkpoint')
+    summary.add_argument('checkpoint')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        cells = merge_checkpoints(args.target, args.checkpoints)
+        print(f"Merged {len(cells)} cells into {args.target}")
+    else:
+        cells = read_checkpoint(args.checkpoint)
+    print_checkpoint_summary(cells, sys.stdout)
@@ -0,0 +1,222 @@
+# Rate-limit-aware scheduling of all provider requests. Per provider there are token buckets for
+# requests/min and tokens/min and a bound on the requests in flight; throttled (429), failed (5xx)
+# and timed out requests are retried with exponential backoff and jitter, honoring Retry-After.
+# A circuit breaker per endpoint fails fast while an endpoint keeps failing (5xx, timeouts);
+# throttling doesn't open it as it only means the quota is used up.
+#
+# Tunable via .env, per provider (CLOUDFLARE, OPENAI, BEDROCK):
+#   <PROVIDER>_RPM            - requests per minute (default unlimited)
+#   <PROVIDER>_TPM            - tokens per minute (default unlimited)
+#   <PROVIDER>_CONCURRENCY    - max. parallel requests (default 4 for Cloudflare and Bedrock, 8 for OpenAI)
+# and for all providers:
+#   LLM_MAX_RETRIES (default 4), LLM_BACKOFF_BASE (default 1s), LLM_BACKOFF_MAX (default 60s),
+#   LLM_BREAKER_THRESHOLD (default 5 consecutive failures), LLM_BREAKER_RESET (default 30s)
+
+import json
+import random
+import threading
+import time
+from config import get_env
+from metrics import estimate_text_tokens, update_call
+
+# Max. parallel requests per provider, the test runners size their thread pools from it
+DEFAULT_CONCURRENCY = {
+    "cloudflare": 4,
+    "openai": 8,
+    "bedrock": 4,
+}
+
+class ProviderError(Exception):
+    def __init__(self, provider, status, message, retry_after=None):
+        super().__init__(f"{provider} request failed ({status or 'no response'}): {message}")
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        # Throttling, server errors and timeouts/connection errors (no status)
+        return self.status is None or self.status in (408, 429) or self.status >= 500
+
+class CircuitOpenError(ProviderError):
+    def __init__(self, provider, endpoint, retry_after):
+        super().__init__(provider, None, f"circuit open for {endpoint}", retry_after)
+
+    @property
+    def retryable(self):
+        # Fail fast instead of queueing up behind an endpoint that keeps failing
+        return False
+
+def parse_retry_after(value):
+    # Only the delay-seconds form is used by the providers
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def estimate_tokens(payload):
+    # Rough estimate (4 characters per token) of the prompt plus the maximum completion
+    prompt_tokens = estimate_text_tokens(json.dumps(payload, ensure_ascii=False))
+    return prompt_tokens + payload.get("max_tokens", 256)
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+class CircuitBreaker:
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        # Returns 0 if the request may be sent, otherwise the seconds until the next trial request
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            # Half-open: let exactly one trial request through
+            if self.trial_running:
+                return self.reset_timeout
+            self.trial_running = True
+            return 0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release_trial(self):
+        # The trial request ended without telling whether the endpoint is up (e.g. it was cancelled or
+        # the response couldn't be read), the next request becomes the trial instead
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+class ProviderScheduler:
+    def __init__(self, provider, rpm=None, tpm=None, max_in_flight=16, max_retries=4, backoff_base=1.0,
+                 backoff_max=60.0, breaker_threshold=5, breaker_reset=30.0):
+        self.provider = provider
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get_breaker(self, endpoint):
+        with self.lock:
+            breaker = self.breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.breakers[endpoint] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def backoff(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def call(self, endpoint, request, estimated_tokens=0):
+        breaker = self.get_breaker(endpoint)
+        attempt = 0
+        error = None
+        while True:
+            wait = breaker.allow()
+            if wait:
+                raise CircuitOpenError(self.provider, endpoint, wait) from error
+            if self.requests:
+                self.requests.acquire(1)
+            if self.tokens and estimated_tokens:
+                self.tokens.acquire(estimated_tokens)
+            with self.in_flight:
+                try:
+                    result = request()
+                except ProviderError as e:
+                    error = e
+                except BaseException:
+                    breaker.release_trial()
+                    raise
+                else:
+                    breaker.record_success()
+                    return result
+            # Throttling and client errors show that the endpoint itself is up
+            if error.retryable and error.status != 429:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if not error.retryable or attempt >= self.max_retries:
+                raise error
+            delay = error.retry_after if error.retry_after is not None else self.backoff(attempt)
+            attempt += 1
+            update_call(retries=attempt)
+            time.sleep(min(delay, self.backoff_max))
+
+def scheduler_from_env(provider):
+    def number(name, default, cast=float):
+        value = get_env(name)
+        return cast(value) if value else default
+    prefix = provider.upper()
+    return ProviderScheduler(
+        provider,
+        rpm=number(f"{prefix}_RPM", None),
+        tpm=number(f"{prefix}_TPM", None),
+        max_in_flight=number(f"{prefix}_CONCURRENCY", DEFAULT_CONCURRENCY.get(provider, 16), int),
+        max_retries=number("LLM_MAX_RETRIES", 4, int),
+        backoff_base=number("LLM_BACKOFF_BASE", 1.0),
+        backoff_max=number("LLM_BACKOFF_MAX", 60.0),
+        breaker_threshold=number("LLM_BREAKER_THRESHOLD", 5, int),
+        breaker_reset=number("LLM_BREAKER_RESET", 30.0),
+    )
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(provider):
+    scheduler = _schedulers.get(provider)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(provider)
+            if scheduler is None:
+                scheduler = _schedulers[provider] = scheduler_from_env(provider)
+    return scheduler
+
+def set_scheduler(provider, scheduler):
+    with _schedulers_lock:
+        _schedulers[provider] = scheduler
+
+def schedule(provider, endpoint, payload, request):
+    return get_scheduler(provider).call(endpoint, request, estimate_tokens(payload))
@@ -0,0 +1,251 @@
+# Long-running extraction service on top of the provider adapters, with an asyncio API and an HTTP
+# endpoint. Requests are queued in a bounded queue and processed by a fixed number of workers, so a
+# burst of submissions is answered with backpressure (the async API waits, HTTP returns 503) instead
+# of piling up blocking calls. Identical (model, context, prompt) requests that are already queued or
+# running share one upstream call.
+#
+#   python3 service.py --port 8080 --workers 32 --queue-size 256
+#   curl -d '{"model": "gpt-4o", "context": "...", "prompt": "..."}' http://127.0.0.1:8080/extract
+#   curl http://127.0.0.1:8080/metrics
+#
+# From Python:
+#   async with ExtractionService() as service:
+#       record = await service.extract("gpt-4o", context, prompt)
+
+import argparse
+import asyncio
+import json
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from api_parser import analyze_with_llm
+from config import load_config
+from metrics import Histogram
+from models import MODELS
+from response_parser import parse_response
+from scheduler import ProviderError
+
+class ServiceBusyError(Exception):
+    pass
+
+class ServiceClosedError(Exception):
+    pass
+
+class ExtractionService:
+    def __init__(self, workers=32, queue_size=256, analyze=analyze_with_llm):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.analyze = analyze
+        self.queue = None
+        self.executor = None
+        self.tasks = []
+        self.pending = {}
+        self.closing = False
+        # Counters and histograms exposed via stats()
+        self.running = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failed = 0
+        self.queue_wait = Histogram()
+        self.latency = {}
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extraction")
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+        return self
+
+    async def stop(self, timeout=30):
+        # Stops accepting requests, finishes the queued and running ones and then stops the workers
+        self.closing = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Requests that were still queued after the timeout
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ServiceClosedError("Service stopped"))
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, future, queued = await self.queue.get()
+            self.queue_wait.observe(time.perf_counter() - queued)
+            self.running += 1
+            try:
+                response = await loop.run_in_executor(self.executor, self.analyze, *key)
+            except asyncio.CancelledError:
+                future.set_exception(ServiceClosedError("Service stopped"))
+                raise
+            except Exception as e:
+                self.failed += 1
+                future.set_exception(e)
+            else:
+                future.set_result(response)
+            finally:
+                self.running -= 1
+                del self.pending[key]
+                self.latency.setdefault(key[0], Histogram()).observe(time.perf_counter() - queued)
+                self.queue.task_done()
+
+    async def analyze_with_llm(self, model, context, prompt, wait=True):
+        # Returns the raw model response. With wait=False a full queue raises ServiceBusyError
+        # instead of waiting for a free slot.
+        if self.closing:
+            raise ServiceClosedError("Service is shutting down")
+        if model not in MODELS:
+            raise ValueError(f"Unknown model {model}")
+        self.submitted += 1
+        key = (model, context, prompt)
+        future = self.pending.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if not wait and self.queue.full():
+                self.rejected += 1
+                raise ServiceBusyError("Queue is full")
+            self.pending[key] = future
+            await self.queue.put((key, future, time.perf_counter()))
+        # Shielded so a cancelled caller doesn't cancel the call other callers are waiting for
+        return await asyncio.shield(future)
+
+    async def extract(self, model, context, prompt, wait=True):
+        return parse_response(await self.analyze_with_llm(model, context, prompt, wait))
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "in_flight": self.running,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "queue_wait_s": self.queue_wait.snapshot(),
+            "latency_s": {model: histogram.snapshot() for model, histogram in self.latency.items()},
+        }
+
+STATUS_TEXTS = {200: "OK", 400: "Bad Request", 404: "Not Found", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+class ServiceServer:
+    # Minimal HTTP/1.1 server on asyncio streams: POST /extract, GET /metrics and GET /health
+    def __init__(self, service, host="127.0.0.1", port=8080):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.server = None
+        self.connections = {}
+
+    async def start(self):
+        await self.service.start()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self, timeout=30):
+        # Stop listening first, then drain the service and close the idle keep-alive connections
+        self.server.close()
+        await self.service.stop(timeout)
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path = request_line.decode("latin-1").split()[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close" and not self.service.closing
+                response_headers = [
+                    f"HTTP/1.1 {status} {STATUS_TEXTS.get(status, '')}",
+                    "Content-Type: application/json",
+                    f"Content-Length: {len(data)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if status == 503:
+                    response_headers.append("Retry-After: 1")
+                writer.write(("\r\n".join(response_headers) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return (503, {"status": "stopping"}) if self.service.closing else (200, {"status": "ok"})
+        if method == "GET" and path == "/metrics":
+            return 200, self.service.stats()
+        if method != "POST" or path != "/extract":
+            return 404, {"error": "Not found"}
+
+        try:
+            request = json.loads(body)
+            model, context, prompt = request["model"], request["context"], request["prompt"]
+        except (ValueError, KeyError, TypeError):
+            return 400, {"error": "Expected a JSON body with model, context and prompt"}
+        if model not in MODELS:
+            return 400, {"error": f"Unknown model {model}"}
+        try:
+            response = await self.service.analyze_with_llm(model, context, prompt, wait=False)
+        except (ServiceBusyError, ServiceClosedError) as e:
+            return 503, {"error": str(e)}
+        except ProviderError as e:
+            return 502, {"error": str(e)}
+        except Exception as e:
+            return 502, {"error": repr(e)}
+        return 200, {"response": response, "record": parse_response(response).as_dict()}
+
+async def serve(host, port, workers, queue_size, shutdown_timeout):
+    load_config()
+    server = await ServiceServer(ExtractionService(workers, queue_size), host, port).start()
+    print(f"Extraction service listening on http://{host}:{server.port}")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stopping.set)
+    await stopping.wait()
+
+    print("Shutting down, finishing queued requests")
+    await server.stop(shutdown_timeout)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=32, help='max. parallel upstream calls')
+    parser.add_argument('--queue-size', type=int, default=256, help='max. queued requests before answering 503')
+    parser.add_argument('--shutdown-timeout', type=float, default=30, help='seconds to finish queued requests on shutdown')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.workers, args.queue_size, args.shutdown_timeout))
@@ -0,0 +1,82 @@
+# Incremental parsing of streamed model responses. The `KEY: value` lines are tracked while the
+# response is streamed so the stream can be cancelled as soon as all fields of the default context
+# have been returned, instead of waiting for any chatter the model generates afterwards. Streams can
+# also be cancelled from another thread (see hedging.py) via the event of a cancellable() block.
+
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from metrics import estimate_text_tokens, fill_missing_usage, update_call
+from response_parser import FIELDS
+
+# Tolerates list markers and markdown bold around the key, e.g. "- **NAME:** Jan"
+FIELD_LINE = re.compile(r"^[\s>*#-]*\**\s*(" + "|".join(FIELDS) + r")\s*\**\s*:", re.IGNORECASE)
+
+_cancel_event = ContextVar("cancel_event", default=None)
+
+class CallCancelledError(Exception):
+    pass
+
+@contextmanager
+def cancellable(event):
+    # Streams consumed within the block stop as soon as the threading.Event is set
+    token = _cancel_event.set(event)
+    try:
+        yield
+    finally:
+        _cancel_event.reset(token)
+
+class FieldTracker:
+    def __init__(self, fields=FIELDS, started=None):
+        self.remaining = {field.upper() for field in fields}
+        self.parts = []
+        self.first_field_s = None
+        self._line = ""
+        self._started = time.perf_counter() if started is None else started
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    @property
+    def complete(self):
+        return not self.remaining
+
+    def feed(self, chunk):
+        # Returns True once every field has been seen on a completed line
+        self.parts.append(chunk)
+        lines = (self._line + chunk).split("\n")
+        self._line = lines.pop()
+        for line in lines:
+            match = FIELD_LINE.match(line)
+            if match:
+                if self.first_field_s is None:
+                    self.first_field_s = time.perf_counter() - self._started
+                self.remaining.discard(match.group(1).upper())
+        return self.complete
+
+def consume_stream(chunks, started, fields=FIELDS, prompt_tokens=None):
+    # Reads text chunks until the stream ends or all fields are parsed. `started` is the
+    # perf_counter() value at the time the request was sent. The caller closes the stream.
+    # The providers send the usage at the end of the stream, so for streams that are stopped early
+    # the missing token counts are estimated from `prompt_tokens` and the text received so far.
+    tracker = FieldTracker(fields, started)
+    stopped_early = False
+    cancel_event = _cancel_event.get()
+    try:
+        for chunk in chunks:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CallCancelledError("Stream cancelled")
+            if len(tracker.parts) == 0:
+                update_call(ttfb_s=time.perf_counter() - started)
+            if tracker.feed(chunk):
+                stopped_early = True
+                break
+    finally:
+        fill_missing_usage(prompt_tokens, estimate_text_tokens(tracker.text))
+    update_call(ttff_s=tracker.first_field_s, stopped_early=stopped_early)
+    if stopped_early:
+        # Drop the beginning of whatever the model started to write after the last field
+        return tracker.text.rsplit("\n", 1)[0]
+    return tracker.text
@@ -1,11 +1,13 @@
 # Test suite to run all tests on all models
 
+import argparse
 import unittest
-import re
-from api_parser import analyze_with_llm
-from datetime import datetime, timedelta
+from api_parser import extract_with_llm
+from dataset import get_steps, load_cases, parse_expected
+from geo import distance_km, get_gazetteer
+from runner import parse_shard, run_matrix
 
-current_llm = None
+MODELS = ['gpt-3.5-turbo-0125', 'llama-2-7b-chat-fp16', 'meta.llama3-70b-instruct-v1:0', 'llama-3-8b-instruct', 'phi-2', 'gemma-7b-it', 'mistral-7b-instruct-v0.2', 'mistral.mistral-large-2402-v1:0', 'anthropic.claude-3-sonnet-20240229-v1:0', 'meta.llama2-13b-chat-v1', 'meta.llama2-70b-chat-v1']
 
 default_context = """You are a system assistant that helps to support APIs with their correct parameters. 
         Please extract the needed data from the user input and always return it in the same format as defined here.
@@ -23,223 +25,81 @@ default_context = """You are a system assistant that helps to support APIs with
         In case you were not able to retrieve some parameter or the user did not provide it please return that value
         as "Unknown", so for example if the GPS coordinates can't be retrieved the response shall be GPS: Unknown."""
 
-default_prompt = """Hello world, this is a great product so I'd like to order the Hummingbird 42. I am Jan from Berlin, 
-        I'd like to be this shipped by 12th of August 2026 and my mail address is jan@foo.com and my address is 
-        Mollstrasse 1 in 10117."""
-
-# Check small town of https://en.wikipedia.org/wiki/Len%C3%A7%C3%B3is Brazil
-brazil_prompt = """Hello world, this is a great product so I'd like to order the Hummingbird 42. I am Jan from Lençóis, 
-        I'd like to be this shipped by 12th of August 2026 and my mail address is jan@foo.com and my address is 
-        Rua José Florêncio 11 in 469600-000."""
-
-german_prompt = """Hallo, dieses Produkt sieht nützlich aus, ich möchte das Hummingbird 42 gern bestellen.
-        Ich bin Jan aus Berlin, der Versand soll bis zum 12. August 2026 erfolgen. Meine Mailadresse ist 
-        jan@foo.com und meine Postanschrift die Mollstrasse 1 in 10117 Berlin."""
-
 def run_tests_with_config(config):
-    global current_llm
-    current_llm = config
-    
-     # Create a test suite
+    # Create a test suite
     suite = unittest.TestSuite()
     
-    # Add test cases from current class to the suite
-    suite.addTest(unittest.makeSuite(TestApiParser))
+    # Add test cases from current class to the suite, each bound to the given model
+    for name in unittest.TestLoader().getTestCaseNames(TestApiParser):
+        suite.addTest(TestApiParser(name, llm=config))
     
     # Create a test runner that will execute the test suite
     runner = unittest.TextTestRunner()
     print(f"\nRunning tests with configuration: {config}")
     runner.run(suite)
 
-def validate_gps_string(gps_string: str) -> bool:
-    # Extract latitude and longitude from the input string
-    match = re.match(r"GPS:\s*(-?\d+\.\d+),(-?\d+\.\d+)", gps_string)
-    if not match:
-        return False
-
-    latitude, longitude = float(match.group(1)), float(match.group(2))
-
-    # Check if latitude /longitude is around 52.XXX / 13.YYY which would be Berlin/Germany
-    valid_latitude = 51 <= latitude <= 53
-    valid_longitude = 12 <= longitude <= 14
-
-    return valid_latitude and valid_longitude
+def validate_gps(gps, location="Berlin", max_km=100) -> bool:
+    # Check if latitude / longitude are close to the location according to the local gazetteer
+    place = get_gazetteer().find(location)
+    return distance_km(*gps, place.latitude, place.longitude) <= max_km
 
 class TestApiParser(unittest.TestCase):
-    def test_analyze_default(self):
-        result = analyze_with_llm(current_llm, default_context, default_prompt)
-        self.assertIn("NAME: Jan", result)
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("ADDRESS: Mollstrasse 1", result)
-        self.assertIn("ZIP: 10117", result)
-        self.assertIn("LOCATION: Berlin", result)
-        self.assertIn("COUNTRY: DE", result)
-        self.assertIn("REQUEST: Order", result)
-        self.assertIn("PRODUCT: Hummingbird 42", result)
-        self.assertIn("DATE: 2026-08-12", result)
-
-    def test_analyze_gps(self):
-        result = analyze_with_llm(current_llm, default_context, default_prompt)
-        self.assertNotIn("GPS: Unknown", result)
-
-        # Get GPS String
-        match = re.search(r"GPS:.*", result, re.IGNORECASE)
-        if match:
-            gps_value = match.group()
-            self.assertTrue(validate_gps_string(gps_value))
+    def __init__(self, methodName='runTest', llm=None):
+        super().__init__(methodName)
+        self.llm = llm
+
+    def assertField(self, result, field, expected):
+        value = getattr(result, field)
+        self.assertIsNotNone(value, f"{field.upper()} not found or invalid in {result}")
+        if isinstance(expected, str):
+            # Same semantics as checking for "FIELD: expected" in the text, but ignoring case and formatting
+            self.assertTrue(value.casefold().startswith(expected.casefold()), f"{field.upper()}: {value!r} does not match {expected!r}")
         else:
-            self.fail("GPS value not found")
-
-    def test_analyze_small_town(self):
-        result = analyze_with_llm(current_llm, default_context, brazil_prompt)
-
-        self.assertIn("ADDRESS: Rua José Florêncio 11", result)
-        self.assertIn("ZIP: 469600-000", result)
-        self.assertIn("LOCATION: Lençóis", result)
-        self.assertIn("COUNTRY: BR", result)
-
-    def test_analyze_timezone(self):
-        result = analyze_with_llm(current_llm, default_context, default_prompt)
-        self.assertIn("TIMEZONE: Europe/Berlin", result)
-
-        result = analyze_with_llm(current_llm, default_context, brazil_prompt)
-        self.assertIn("TIMEZONE: America/Bahia", result)
-    
-    def test_real_name(self):
-        prompt = """Hello world, this is a great product so I'd like to order the Hummingbird 42. My formal name is Maximilian 
-        however everybody just calls me Max, I come from Berlin and I'd like to be this shipped by 12th of August 2026 and my mail
-        address is max@foo.com and my address is Mollstrasse 1 in 10117."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
-
-        self.assertIn("NAME: Maximilian", result)
-
-    def test_dates(self):
-        prompt = """Hello world, this is a great product so I'd like to order the Hummingbird 42. I am Jan from Berlin, 
-        I'd like to be this shipped by 2026-08-12 and my mail address is jan@foo.com and my address is 
-        Mollstrasse 1 in 10117."""
-        result = analyze_with_llm(current_llm, default_context, prompt)
-        self.assertIn("DATE: 2026-08-12", result)
-
-        prompt = """Hello world, this is a great product so I'd like to order the Hummingbird 42. I am Jan from Berlin, 
-        I'd like to be this shipped by 2026 08 12 and my mail address is jan@foo.com and my address is 
-        Mollstrasse 1 in 10117."""
-        result = analyze_with_llm(current_llm, default_context, prompt)
-        self.assertIn("DATE: 2026-08-12", result)
-
-        result = analyze_with_llm(current_llm, default_context, german_prompt)
-        self.assertIn("DATE: 2026-08-12", result)
-
-    def test_tomorrow(self):
-        prompt = """Hello world, this is a great product so I'd like to order the Hummingbird 42. I am Jan from Berlin, 
-        I need this rather urgent until tomorrow, my mail address is jan@foo.com and my address is 
-        Mollstrasse 1 in 10117."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
+            self.assertEqual(value, expected)
 
-        tomorrow = datetime.today() + timedelta(days=1)
-        tomorrow_date_string = tomorrow.strftime('%Y-%m-%d')
-        self.assertIn("DATE: " + tomorrow_date_string, result)
+    def assertUnknown(self, result, field):
+        self.assertTrue(result.is_unknown(field), f"{field.upper()} is not Unknown in {result}")
 
-    def test_missing_product(self):
-        prompt = """Hello world, this is a great product so I'd like to order. I am Jan from Berlin, 
-        I'd like to be this shipped by 12th of August 2026 and my mail address is jan@foo.com and my address is 
-        Mollstrasse 1 in 10117."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
-
-        self.assertIn("PRODUCT: Unknown", result)
-
-    def test_language_german(self):
-        result = analyze_with_llm(current_llm, default_context, german_prompt)
-        self.assertIn("NAME: Jan", result)
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("ADDRESS: Mollstrasse 1", result)
-        self.assertIn("ZIP: 10117", result)
-        self.assertIn("LOCATION: Berlin", result)
-        self.assertIn("COUNTRY: DE", result)
-        self.assertIn("REQUEST: Order", result)
-        self.assertIn("PRODUCT: Hummingbird 42", result)
-        self.assertIn("DATE: 2026-08-12", result)
-
-    def test_language_romanian(self):
-        prompt = """Buna ziua, acest produs pare util, as dori sa comand Hummingbird 42.
-         Sunt Jan din Romania, expedierea ar trebui să aibă loc până pe 12 august 2026. Adresa mea de e-mail este
-         jan@foo.com și adresa mea poștală este Strada Tudor Vladimirescu 12 în Sinaia 106100."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
-        self.assertIn("NAME: Jan", result)
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("ADDRESS: Strada Tudor Vladimirescu 12", result)
-        self.assertIn("ZIP: 106100", result)
-        self.assertIn("LOCATION: Sinaia", result)
-        self.assertIn("COUNTRY: RO", result)
-        self.assertIn("REQUEST: Order", result)
-        self.assertIn("PRODUCT: Hummingbird 42", result)
-        self.assertIn("DATE: 2026-08-12", result)
-        self.assertIn("TIMEZONE: Europe/Bucharest", result)
-
-    def test_invalid_request_type(self):
-        prompt = """Hello world, I am not sure what I want here regarding the Hummingbird 42 but I am writing anyway
-        just to waste a little of your time. I am Jan from Berlin, my favourite date of them all is 12th of August 2026 
-        and my mail address is jan@foo.com and my address is Mollstrasse 1 in 10117."""
-        
-        result = analyze_with_llm(current_llm, default_context, prompt)
-
-        self.assertIn("REQUEST: Unknown", result)
-
-    def test_typos(self):
-        prompt = """Hello world, this is a great product so I'd like to oder the Hummingbird 42. I am Jan from Brli9n (capital 
-        of Germany), I'd like to be this shipped by 34th of August 2026 and my mail address is jan-at-foo.com and my address is 
-        Mollstrasse 1 in 10117."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
-
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("LOCATION: Berlin", result)
-        self.assertIn("COUNTRY: DE", result)
-        self.assertIn("REQUEST: Order", result)
-        self.assertIn("DATE: Unknown", result)
-
-    def test_complaint(self):
-        prompt = """Hello world, I am very unhappy with the Hummingbird 42. I turned it on and all I see is some
-        flashing LED and that is it. Power supply seems to be working. I am Jan from Berlin and ordered the
-        product on 10th of October 2021 and my mail address is jan@foo.com."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
-
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("PRODUCT: Hummingbird 42", result)
-        self.assertIn("REQUEST: Complaint", result)
-        self.assertIn("DATE: 2021-10-10", result)
-
-    def test_info(self):
-        prompt = """Hello world, this is Jan from Berlin. Can you send me more details about the Hummingbird 42 until 21st of July
-        2025? You can reach me at jan@foo.com."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
-
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("PRODUCT: Hummingbird 42", result)
-        self.assertIn("REQUEST: Info", result)
-        self.assertIn("DATE: 2025-07-21", result)
-    
-    def test_swap_mail_and_email(self):
-        prompt = """Hello world, this is a great product so I'd like to order the Hummingbird 42. I am Jan from Berlin, 
-        I'd like to be this shipped by 12th of August 2026 and you can send it to jan@foo.com. My mail address is 
-        Mollstrasse 1 in 10117."""
-
-        result = analyze_with_llm(current_llm, default_context, prompt)
-
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("PRODUCT: Hummingbird 42", result)
-        self.assertIn("REQUEST: Order", result)
-        self.assertIn("ADDRESS: Mollstrasse 1", result)
-        self.assertIn("ZIP: 10117", result)
-        self.assertIn("LOCATION: Berlin", result)
-        self.assertIn("COUNTRY: DE", result)
+    def assertExpected(self, result, field, expected):
+        if field == "gps":
+            self.assertIsNotNone(result.gps, "GPS value not found")
+            self.assertTrue(validate_gps(result.gps, expected["near"], expected.get("max_km", 100)),
+                            f"GPS: {result.gps} is not near {expected['near']}")
+        else:
+            self.assertField(result, field, parse_expected(field, expected))
+
+    def check_case(self, case):
+        for step in get_steps(case):
+            result = extract_with_llm(self.llm, case.get("context", default_context), step["prompt"])
+            for field, expected in step.get("expect", {}).items():
+                self.assertExpected(result, field, expected)
+            for field in step.get("unknown", []):
+                self.assertUnknown(result, field)
+
+def make_test(case):
+    def test(self):
+        self.check_case(case)
+    test.case = case
+    return test
+
+# One test method per case of the dataset
+for case in load_cases():
+    setattr(TestApiParser, case["id"], make_test(case))
 
 if __name__ == '__main__':
-    for config in ['gpt-3.5-turbo-0125', 'llama-2-7b-chat-fp16', 'meta.llama3-70b-instruct-v1:0', 'llama-3-8b-instruct', 'phi-2', 'gemma-7b-it', 'mistral-7b-instruct-v0.2', 'mistral.mistral-large-2402-v1:0', 'anthropic.claude-3-sonnet-20240229-v1:0', 'meta.llama2-13b-chat-v1', 'meta.llama2-70b-chat-v1']:
-    #for config in ['gpt-4-turbo-2024-04-09']:
-        run_tests_with_config(config)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=MODELS, help='models to run the tests against')
+    parser.add_argument('--workers', type=int, help='threads per provider (default: its concurrency limit)')
+    parser.add_argument('--serial', action='store_true', help='run one model after the other')
+    parser.add_argument('--results', help='JSONL or CSV file to append the per-call records to')
+    parser.add_argument('--checkpoint', help='JSONL file of finished cells, cells already passed or failed are skipped')
+    parser.add_argument('--shard', type=parse_shard, help='run only shard i of n of the matrix, e.g. 2/4')
+    parser.add_argument('--rerun-failures', action='store_true', help='also run the cells again that failed')
+    args = parser.parse_args()
+
+    if args.serial:
+        for config in args.models:
+            run_tests_with_config(config)
+    else:
+        run_matrix(TestApiParser, args.models, max_workers=args.workers, results_path=args.results,
+                   checkpoint_path=args.checkpoint, shard=args.shard, rerun_failures=args.rerun_failures)
@@ -0,0 +1,57 @@
+# Offline tests of the settings in config.py, no provider is called
+#
+#   python3 -m unittest test_config
+
+import os
+import tempfile
+import unittest
+import config
+
+class TestConfig(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.saved = config.ENV_FILE, config._loaded
+        config.ENV_FILE = os.path.join(self.directory.name, ".env")
+        config._loaded = False
+        self.names = []
+
+    def tearDown(self):
+        config.ENV_FILE, config._loaded = self.saved
+        for name in self.names:
+            os.environ.pop(name, None)
+        self.directory.cleanup()
+
+    def write_env(self, **values):
+        with open(config.ENV_FILE, "w", encoding="utf-8") as file:
+            for name, value in values.items():
+                file.write(f"{name}={value}\n")
+                self.names.append(name)
+
+    def test_value_only_in_env_file(self):
+        self.write_env(LLM_TEST_SETTING="from-dotenv")
+        self.assertNotIn("LLM_TEST_SETTING", os.environ)
+        self.assertEqual(config.get_env("LLM_TEST_SETTING"), "from-dotenv")
+
+    def test_environment_wins_over_env_file(self):
+        self.write_env(LLM_TEST_SETTING="from-dotenv")
+        os.environ["LLM_TEST_SETTING"] = "from-environment"
+        self.assertEqual(config.get_env("LLM_TEST_SETTING"), "from-environment")
+
+    def test_default(self):
+        self.write_env()
+        self.assertEqual(config.get_env("LLM_TEST_MISSING", "default"), "default")
+
+    def test_provider_concurrency_from_env_file(self):
+        from scheduler import scheduler_from_env
+
+        self.write_env(CLOUDFLARE_CONCURRENCY="3")
+        self.assertEqual(scheduler_from_env("cloudflare").max_in_flight, 3)
+
+    def test_cases_from_env_file(self):
+        from dataset import get_cases_path
+
+        self.write_env(TEST_CASES="cases/other.jsonl")
+        self.assertEqual(get_cases_path(), "cases/other.jsonl")
+
+if __name__ == '__main__':
+    unittest.main()
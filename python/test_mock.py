@@ -0,0 +1,192 @@
+# Offline tests of the provider adapters, response cache, scheduler retries, early stopping of
+# streams and pre-extraction against the local mock provider server (mock_server.py). The provider
+# SDKs have to be installed, no credentials are needed.
+#
+#   python3 -m unittest test_mock
+
+import io
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+from api_parser import extract_with_llm
+from cache import ResponseCache, set_cache
+from clients import reset_clients
+from hedging import LatencyEstimator, extract_with_hedging
+from metrics import collect
+from mock_server import DEFAULT_ANSWER, MockConfig, MockProviderServer
+from pre_extract import extract_with_pre_extraction, pre_extract
+from scheduler import ProviderScheduler, set_scheduler
+from test_api_parser import default_context
+
+PROMPT = """Hello world, this is a great product so I'd like to order the Hummingbird 42. I am Jan from Berlin,
+        I'd like to be this shipped by 12th of August 2026 and my mail address is jan@foo.com and my address is
+        Mollstrasse 1 in 10117."""
+CHATTER = "\n\nPlease let me know if you need anything else, I am happy to help with more details." * 20
+MODELS = ("llama-3-8b-instruct", "gpt-4o-mini", "meta.llama3-70b-instruct-v1:0",
+          "anthropic.claude-3-sonnet-20240229-v1:0", "mistral.mistral-large-2402-v1:0")
+
+class TestMockProviders(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockProviderServer().start()
+        cls.environment = mock.patch.dict(os.environ, {**cls.server.environment(), "LLM_STREAMING": "0", "LLM_PRE_EXTRACT": "0"})
+        cls.environment.start()
+        reset_clients()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.environment.stop()
+        reset_clients()
+
+    def setUp(self):
+        self.server.config = MockConfig()
+        set_cache(ResponseCache(mode="off"))
+        for provider in ("cloudflare", "openai", "bedrock"):
+            set_scheduler(provider, ProviderScheduler(provider, max_retries=5, backoff_base=0.01, breaker_threshold=100))
+
+    def tearDown(self):
+        set_cache(None)
+
+    def test_providers(self):
+        for model in MODELS:
+            for stream in (False, True):
+                with self.subTest(model=model, stream=stream), collect() as records:
+                    result = extract_with_llm(model, default_context, PROMPT, stream)
+                    self.assertTrue(result.complete, result)
+                    self.assertEqual(result.mail, "jan@foo.com")
+                    self.assertEqual(len(records), 1)
+                    self.assertFalse(records[0]["cached"])
+                    self.assertIsNotNone(records[0]["ttfb_s"])
+                    self.assertIsNotNone(records[0]["connect_s"])
+                    self.assertIsNotNone(records[0]["input_tokens"])
+                    self.assertIsNotNone(records[0]["output_tokens"])
+
+    def test_connect_time(self):
+        # New connections report their connect time, reused ones 0
+        for model in ("llama-3-8b-instruct", "gpt-4o-mini", "meta.llama3-70b-instruct-v1:0"):
+            with self.subTest(model=model), collect() as records:
+                reset_clients()
+                extract_with_llm(model, default_context, PROMPT)
+                extract_with_llm(model, default_context, PROMPT)
+                self.assertGreater(records[0]["connect_s"], 0)
+                self.assertEqual(records[1]["connect_s"], 0)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            set_cache(ResponseCache(directory=directory, mode="readwrite"))
+            requests = self.server.requests
+            with collect() as records:
+                first = extract_with_llm("gpt-4o-mini", default_context, PROMPT)
+                second = extract_with_llm("gpt-4o-mini", default_context, PROMPT)
+            self.assertEqual(self.server.requests, requests + 1)
+            self.assertEqual(first.as_dict(), second.as_dict())
+            self.assertEqual([record["cached"] for record in records], [False, True])
+            self.assertEqual(records[1]["cost_usd"], 0.0)
+
+    def test_retries(self):
+        # Every second request fails with a 500, the scheduler retries them
+        self.server.config = MockConfig(error_rate=0.5, seed=1)
+        with collect() as records:
+            for _ in range(10):
+                self.assertTrue(extract_with_llm("llama-3-8b-instruct", default_context, PROMPT).complete)
+        self.assertGreater(sum(record["retries"] for record in records), 0)
+        self.assertTrue(all(record["error"] is None for record in records))
+
+    def test_early_stop(self):
+        self.server.config = MockConfig(default_answer=DEFAULT_ANSWER + CHATTER, token_delay=0.001)
+        stderr = io.StringIO()
+        with mock.patch.object(sys, "stderr", stderr):
+            for model in ("llama-3-8b-instruct", "gpt-4o-mini", "meta.llama3-70b-instruct-v1:0"):
+                with self.subTest(model=model), collect() as records:
+                    result = extract_with_llm(model, default_context, PROMPT, True)
+                    self.assertTrue(result.complete, result)
+                    record = records[0]
+                    self.assertTrue(record["stopped_early"])
+                    self.assertIsNotNone(record["input_tokens"])
+                    self.assertIsNotNone(record["output_tokens"])
+                    # The chatter after the fields is neither read nor counted
+                    self.assertLess(record["output_tokens"], len(DEFAULT_ANSWER + CHATTER) // 4)
+                    if model != "llama-3-8b-instruct":
+                        self.assertIsNotNone(record["cost_usd"])
+            # Give the server time to notice the closed connections
+            time.sleep(0.2)
+        self.assertNotIn("Traceback", stderr.getvalue())
+
+    def test_early_stop_requested_fields(self):
+        # The stream stops once the fields of the context are there, not only after all fields
+        context = "Return the fields\nNAME: <User name>\nMAIL: <User e-mail address>"
+        self.server.config = MockConfig(token_delay=0.001)
+        for model in ("llama-3-8b-instruct", "gpt-4o-mini", "anthropic.claude-3-sonnet-20240229-v1:0"):
+            with self.subTest(model=model), collect() as records:
+                result = extract_with_llm(model, context, PROMPT, True)
+                self.assertEqual((result.name, result.mail), ("Jan", "jan@foo.com"))
+                self.assertTrue(records[0]["stopped_early"])
+                self.assertIsNone(result.product)
+        time.sleep(0.2)
+
+    def test_hedging(self):
+        # The hedged calls run in the executor's threads, their records still reach collect()
+        with collect() as records:
+            model, result = extract_with_hedging(["gpt-4o-mini", "llama-3-8b-instruct"], default_context, PROMPT, False)
+        self.assertEqual(model, "gpt-4o-mini")
+        self.assertTrue(result.complete, result)
+        self.assertEqual([record["model"] for record in records], ["gpt-4o-mini"])
+
+    def test_hedging_requested_fields(self):
+        # An answer with all fields the context asked for is valid, the next model isn't asked
+        context = "Return the fields\nNAME: <User name>\nMAIL: <User e-mail address>"
+        self.server.config = MockConfig(default_answer="NAME: Jan\nMAIL: jan@foo.com")
+        with collect() as records:
+            model, result = extract_with_hedging(["gpt-4o-mini", "llama-3-8b-instruct"], context, PROMPT, False)
+        self.assertEqual((model, result.mail), ("gpt-4o-mini", "jan@foo.com"))
+        self.assertEqual(len(records), 1)
+
+    def test_hedging_settings(self):
+        estimator = LatencyEstimator()
+        estimator.observe("gpt-4o-mini", 0.5)
+        with mock.patch.dict(os.environ, {"HEDGE_MIN_SAMPLES": "1", "HEDGE_DEFAULT_DELAY": "3"}):
+            self.assertEqual(estimator.p95("gpt-4o-mini"), 0.5)
+            self.assertEqual(estimator.p95("llama-3-8b-instruct"), 3.0)
+
+    def test_pre_extraction(self):
+        with collect() as records:
+            result = extract_with_pre_extraction("gpt-4o-mini", default_context, PROMPT)
+        self.assertTrue(result.complete, result)
+        self.assertGreater(records[0]["pre_extracted"], 0)
+
+    def test_pre_extraction_catalog(self):
+        # Products are only read from the prompt with a catalog, locations come from the gazetteer
+        fields = pre_extract(PROMPT)
+        self.assertNotIn("PRODUCT", fields)
+        self.assertEqual((fields["LOCATION"], fields["COUNTRY"]), ("Berlin", "DE"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "products.txt")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("Hummingbird 42\nHummingbird 42 Pro\n")
+            with mock.patch.dict(os.environ, {"PRE_EXTRACT_PRODUCTS": path}):
+                self.assertEqual(pre_extract(PROMPT)["PRODUCT"], "Hummingbird 42")
+
+    def test_pre_extraction_cues(self):
+        # Place names and numbers without a locative cue or within a phone number are left to the model
+        self.assertEqual(pre_extract("Hi, this is Santiago, my mail is santiago@foo.com"), {"MAIL": "santiago@foo.com"})
+        self.assertEqual(pre_extract("My name is Lima, call me at 030 123456 or +49 30 123456"), {})
+        fields = pre_extract("Ich bin Jan aus Brașov, Strada Lungă 1 in 500035")
+        self.assertEqual((fields["LOCATION"], fields["COUNTRY"], fields["ZIP"]), ("Brașov", "RO", "500035"))
+
+    def test_pre_extraction_without_call(self):
+        # All requested fields can be read from the prompt, the provider is not called
+        context = "Return the fields\nMAIL: <User e-mail address>\nDATE: <Date in ISO8601 format>"
+        requests = self.server.requests
+        with collect() as records:
+            result = extract_with_pre_extraction("gpt-4o-mini", context, PROMPT)
+        self.assertEqual(self.server.requests, requests)
+        self.assertEqual(result.mail, "jan@foo.com")
+        self.assertEqual(str(result.date), "2026-08-12")
+        self.assertEqual(records[0]["input_tokens"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Offline tests of the response parser, which decides the outcome of every test case
+#
+#   python3 -m unittest test_response_parser
+
+import unittest
+from datetime import date
+from response_parser import parse_response
+
+class TestParseResponse(unittest.TestCase):
+    def test_plain(self):
+        result = parse_response("NAME: Jan\nMAIL: jan@foo.com\nDATE: 2026-08-12\nREQUEST: order\nTIMEZONE: Europe/Berlin (CEST)")
+        self.assertEqual(result.name, "Jan")
+        self.assertEqual(result.mail, "jan@foo.com")
+        self.assertEqual(result.date, date(2026, 8, 12))
+        self.assertEqual(result.request, "Order")
+        self.assertEqual(result.timezone, "Europe/Berlin")
+
+    def test_markdown(self):
+        result = parse_response("Here you go:\n\n1. **Name:** Jan\n- **MAIL**: `<mailto:Jan@Foo.com>`\n> ### Product: \"Hummingbird 42\"")
+        self.assertEqual(result.name, "Jan")
+        self.assertEqual(result.mail, "jan@foo.com")
+        self.assertEqual(result.product, "Hummingbird 42")
+
+    def test_inline_keys(self):
+        result = parse_response("NAME: Jan MAIL: jan@foo.com **ZIP**: 10117")
+        self.assertEqual((result.name, result.mail, result.zip), ("Jan", "jan@foo.com", "10117"))
+
+    def test_first_occurrence_wins(self):
+        self.assertEqual(parse_response("NAME: Jan\nSummary:\nNAME: Max").name, "Jan")
+
+    def test_gps(self):
+        for value, expected in (
+            ("52.52, 13.405", (52.52, 13.405)),
+            ("52.52° N, 13.405° E", (52.52, 13.405)),
+            ("12.5628° S, 41.3889° W", (-12.5628, -41.3889)),
+            ("-12.5628, -41.3889", (-12.5628, -41.3889)),
+            ("52°31'12\"N 13°24'18\"E", (52.52, 13.405)),
+            ("52°31′12″N, 13°24′18″E", (52.52, 13.405)),
+            ("52°31'N 13°24'E", (52 + 31 / 60, 13.4)),
+        ):
+            with self.subTest(value=value):
+                latitude, longitude = parse_response(f"GPS: {value}").gps
+                self.assertAlmostEqual(latitude, expected[0], places=3)
+                self.assertAlmostEqual(longitude, expected[1], places=3)
+
+    def test_invalid_gps(self):
+        for value in ("somewhere in Berlin", "52°75'N 13°24'E", "95.0, 13.4"):
+            with self.subTest(value=value):
+                result = parse_response(f"GPS: {value}")
+                self.assertIsNone(result.gps)
+                self.assertIn("GPS", result.invalid)
+                self.assertFalse(result.is_unknown("gps"))
+
+    def test_unknown(self):
+        for value in ("Unknown", "unknown.", "N/A", "None", "-", "", "Unknown (not mentioned)",
+                      "**Unknown** - the user did not name a product", "Unknown, not provided"):
+            with self.subTest(value=value):
+                result = parse_response(f"PRODUCT: {value}")
+                self.assertTrue(result.is_unknown("product"))
+                self.assertIsNone(result.product)
+
+    def test_not_unknown(self):
+        self.assertFalse(parse_response("PRODUCT: Unknownia 3000").is_unknown("product"))
+        self.assertFalse(parse_response("NAME: Jan").is_unknown("product"))
+
+    def test_country(self):
+        for value, expected in (("DE", "DE"), ("de", "DE"), ("Germany", "DE"), ("Deutschland", "DE"),
+                                ("DE (Germany)", "DE"), ("Brasil", "BR"), ("România", "RO"), ("USA", "US")):
+            with self.subTest(value=value):
+                self.assertEqual(parse_response(f"COUNTRY: {value}").country, expected)
+
+    def test_request(self):
+        self.assertEqual(parse_response("REQUEST: Complaint.").request, "Complaint")
+        # Unmapped wordings are kept
+        self.assertEqual(parse_response("REQUEST: Refund").request, "Refund")
+
+    def test_complete(self):
+        text = "\n".join(f"{field}: Unknown" for field in ("NAME", "MAIL", "ADDRESS", "ZIP", "LOCATION", "COUNTRY",
+                                                           "REQUEST", "PRODUCT", "DATE", "GPS", "TIMEZONE"))
+        self.assertTrue(parse_response(text).complete)
+        self.assertFalse(parse_response("NAME: Jan").complete)
+        self.assertFalse(parse_response(text.replace("DATE: Unknown", "DATE: soon")).complete)
+
+if __name__ == '__main__':
+    unittest.main()
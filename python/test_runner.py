@@ -0,0 +1,130 @@
+# Offline tests of the checkpoints and shards of runner.py with a stub test class, no provider is called
+#
+#   python3 -m unittest test_runner
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from runner import (end_checkpoint_line, in_shard, is_done, merge_checkpoints, parse_shard, read_checkpoint,
+                    run_matrix)
+
+MODELS = ("gpt-4o-mini", "llama-3-8b-instruct")
+
+def make_stub_tests(runs):
+    # Appends (model, test) to runs, test_fail always fails. Built per test so the loader doesn't pick it up.
+    class StubTests(unittest.TestCase):
+        def __init__(self, name, llm=None):
+            super().__init__(name)
+            self.llm = llm
+
+        def test_pass(self):
+            runs.append((self.llm, "test_pass"))
+
+        def test_fail(self):
+            runs.append((self.llm, "test_fail"))
+            self.fail("expected failure")
+
+    StubTests.test_pass.case = {"id": "test_pass", "prompt": "version 1"}
+    return StubTests
+
+def entry(model, test, outcome, finished_at, version=None):
+    return {"model": model, "test": test, "version": version, "outcome": outcome, "run_id": "run",
+            "finished_at": finished_at, "duration_s": 0.1, "message": None}
+
+class TestRunner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "checkpoint.jsonl")
+        self.runs = []
+        self.tests = make_stub_tests(self.runs)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, path, entries, tail=""):
+        with open(path, "w", encoding="utf-8") as file:
+            for item in entries:
+                file.write(json.dumps(item) + "\n")
+            file.write(tail)
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (1, 4))
+        for value in ("0/4", "5/4", "x"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_shard(value)
+
+    def test_shards_partition_the_matrix(self):
+        cells = [(f"model-{model}", f"test_{test}") for model in range(5) for test in range(40)]
+        shards = [[cell for cell in cells if in_shard(*cell, (index, 3))] for index in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(cells))
+        self.assertTrue(all(shards))
+
+    def test_is_done(self):
+        self.assertFalse(is_done(None, "v1"))
+        self.assertTrue(is_done(entry("m", "t", "pass", 1, "v1"), "v1"))
+        self.assertTrue(is_done(entry("m", "t", "fail", 1, "v1"), "v1"))
+        self.assertTrue(is_done(entry("m", "t", "skip", 1, "v1"), "v1"))
+        # Errors run again, as do cells of another version of the case
+        self.assertFalse(is_done(entry("m", "t", "error", 1, "v1"), "v1"))
+        self.assertFalse(is_done(entry("m", "t", "pass", 1, "v1"), "v2"))
+        self.assertFalse(is_done(entry("m", "t", "fail", 1, "v1"), "v1", rerun_failures=True))
+        self.assertTrue(is_done(entry("m", "t", "pass", 1, "v1"), "v1", rerun_failures=True))
+
+    def test_truncated_last_line(self):
+        self.write(self.path, [entry("m", "t1", "pass", 1)], tail='{"model": "m", "test": "t2", "outc')
+        self.assertEqual(list(read_checkpoint(self.path)), [("m", "t1")])
+        end_checkpoint_line(self.path)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry("m", "t3", "pass", 2)) + "\n")
+        self.assertEqual(sorted(read_checkpoint(self.path)), [("m", "t1"), ("m", "t3")])
+
+    def test_end_checkpoint_line(self):
+        end_checkpoint_line(os.path.join(self.directory.name, "missing.jsonl"))
+        self.write(self.path, [entry("m", "t1", "pass", 1)])
+        end_checkpoint_line(self.path)
+        with open(self.path, encoding="utf-8") as file:
+            self.assertEqual(file.read().count("\n"), 1)
+
+    def test_latest_entry_wins(self):
+        self.write(self.path, [entry("m", "t", "error", 1), entry("m", "t", "pass", 2), entry("m", "t", "fail", 0)])
+        self.assertEqual(read_checkpoint(self.path)[("m", "t")]["outcome"], "pass")
+
+    def test_merge_checkpoints(self):
+        first, second = (os.path.join(self.directory.name, name) for name in ("1.jsonl", "2.jsonl"))
+        self.write(first, [entry("a", "t", "error", 1), entry("b", "t", "pass", 1)])
+        self.write(second, [entry("a", "t", "pass", 2), entry("c", "t", "fail", 1)])
+        cells = merge_checkpoints(self.path, [first, second])
+        self.assertEqual({key: cell["outcome"] for key, cell in cells.items()},
+                         {("a", "t"): "pass", ("b", "t"): "pass", ("c", "t"): "fail"})
+        self.assertEqual(read_checkpoint(self.path), cells)
+
+    def test_resume(self):
+        run_matrix(self.tests, MODELS, stream=io.StringIO(), checkpoint_path=self.path)
+        self.assertEqual(len(self.runs), 4)
+        # Nothing left to run, failures only with rerun_failures
+        self.runs.clear()
+        run_matrix(self.tests, MODELS, stream=io.StringIO(), checkpoint_path=self.path)
+        self.assertEqual(self.runs, [])
+        run_matrix(self.tests, MODELS, stream=io.StringIO(), checkpoint_path=self.path, rerun_failures=True)
+        self.assertEqual(sorted(self.runs), sorted((model, "test_fail") for model in MODELS))
+
+    def test_resume_changed_case(self):
+        run_matrix(self.tests, MODELS, stream=io.StringIO(), checkpoint_path=self.path)
+        self.runs.clear()
+        self.tests.test_pass.case = {"id": "test_pass", "prompt": "version 2"}
+        run_matrix(self.tests, MODELS, stream=io.StringIO(), checkpoint_path=self.path)
+        self.assertEqual(sorted(self.runs), sorted((model, "test_pass") for model in MODELS))
+
+    def test_shards(self):
+        # Each shard runs its part of the matrix, the merged checkpoints cover all of it
+        paths = []
+        for index in range(2):
+            paths.append(os.path.join(self.directory.name, f"shard-{index}.jsonl"))
+            run_matrix(self.tests, MODELS, stream=io.StringIO(), checkpoint_path=paths[-1], shard=(index, 2))
+        self.assertEqual(sorted(self.runs), sorted((model, name) for model in MODELS for name in ("test_fail", "test_pass")))
+        self.assertEqual(len(merge_checkpoints(self.path, paths)), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+# Offline tests of the retries and the circuit breaker in scheduler.py, no provider is called
+#
+#   python3 -m unittest test_scheduler
+
+import time
+import unittest
+from scheduler import CircuitOpenError, ProviderError, ProviderScheduler
+
+class TestProviderScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ProviderScheduler("openai", max_retries=0, breaker_threshold=1, breaker_reset=0.01)
+
+    def fail(self, status):
+        def request():
+            raise ProviderError("openai", status, "failed")
+        return request
+
+    def test_retries(self):
+        scheduler = ProviderScheduler("openai", max_retries=2, backoff_base=0.001)
+        responses = iter([self.fail(500), self.fail(429), lambda: "ok"])
+        self.assertEqual(scheduler.call("endpoint", lambda: next(responses)()), "ok")
+
+    def test_breaker_opens(self):
+        scheduler = ProviderScheduler("openai", max_retries=0, breaker_threshold=1, breaker_reset=60.0)
+        with self.assertRaises(ProviderError):
+            scheduler.call("endpoint", self.fail(500))
+        with self.assertRaises(CircuitOpenError):
+            scheduler.call("endpoint", lambda: "ok")
+
+    def test_trial_with_other_error(self):
+        # A trial request that fails with anything but a ProviderError must not keep the circuit open
+        with self.assertRaises(ProviderError):
+            self.scheduler.call("endpoint", self.fail(500))
+        time.sleep(0.02)
+        with self.assertRaises(KeyError):
+            self.scheduler.call("endpoint", lambda: {}["result"])
+        self.assertEqual(self.scheduler.call("endpoint", lambda: "ok"), "ok")
+        self.assertEqual(self.scheduler.call("endpoint", lambda: "ok"), "ok")
+
+if __name__ == '__main__':
+    unittest.main()
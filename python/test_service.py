@@ -0,0 +1,133 @@
+# Offline tests of the extraction service with a stub in place of the provider calls
+#
+#   python3 -m unittest test_service
+
+import asyncio
+import json
+import threading
+import unittest
+from service import ExtractionService, ServiceBusyError, ServiceClosedError, ServiceServer
+
+ANSWER = "NAME: Jan\nMAIL: jan@foo.com"
+
+class StubAnalyze:
+    # Blocks every call until released, like a slow provider
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, model, context, prompt):
+        self.calls.append((model, context, prompt))
+        self.release.wait(5)
+        return f"{ANSWER}\nPRODUCT: {prompt}"
+
+async def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+class TestExtractionService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.analyze = StubAnalyze()
+        self.service = await ExtractionService(workers=1, queue_size=1, analyze=self.analyze).start()
+
+    async def asyncTearDown(self):
+        self.analyze.release.set()
+        if not self.service.closing:
+            await self.service.stop(timeout=1)
+
+    async def test_coalescing(self):
+        callers = [asyncio.create_task(self.service.extract("gpt-4o-mini", "context", "same")) for _ in range(5)]
+        await wait_for(lambda: self.analyze.calls)
+        self.analyze.release.set()
+        records = await asyncio.gather(*callers)
+        self.assertEqual(len(self.analyze.calls), 1)
+        self.assertEqual({record.product for record in records}, {"same"})
+        self.assertEqual(self.service.stats()["coalesced"], 4)
+
+    async def test_backpressure(self):
+        running = asyncio.create_task(self.service.analyze_with_llm("gpt-4o-mini", "context", "first"))
+        await wait_for(lambda: self.service.running == 1)
+        queued = asyncio.create_task(self.service.analyze_with_llm("gpt-4o-mini", "context", "second"))
+        await wait_for(lambda: self.service.queue.full())
+        with self.assertRaises(ServiceBusyError):
+            await self.service.analyze_with_llm("gpt-4o-mini", "context", "third", wait=False)
+        # The async API waits for a free slot instead
+        waiting = asyncio.create_task(self.service.analyze_with_llm("gpt-4o-mini", "context", "fourth"))
+        self.analyze.release.set()
+        await asyncio.gather(running, queued, waiting)
+        self.assertEqual([call[2] for call in self.analyze.calls], ["first", "second", "fourth"])
+        self.assertEqual(self.service.stats()["rejected"], 1)
+
+    async def test_graceful_shutdown(self):
+        running = asyncio.create_task(self.service.analyze_with_llm("gpt-4o-mini", "context", "first"))
+        await wait_for(lambda: self.service.running == 1)
+        queued = asyncio.create_task(self.service.analyze_with_llm("gpt-4o-mini", "context", "second"))
+        await wait_for(lambda: self.service.queue.full())
+        stopping = asyncio.create_task(self.service.stop(timeout=5))
+        await wait_for(lambda: self.service.closing)
+        with self.assertRaises(ServiceClosedError):
+            await self.service.analyze_with_llm("gpt-4o-mini", "context", "third")
+        # Requests accepted before the shutdown are still answered
+        self.analyze.release.set()
+        await stopping
+        self.assertIn("first", await running)
+        self.assertIn("second", await queued)
+
+    async def test_shutdown_timeout(self):
+        running = asyncio.create_task(self.service.analyze_with_llm("gpt-4o-mini", "context", "first"))
+        await wait_for(lambda: self.service.running == 1)
+        queued = asyncio.create_task(self.service.analyze_with_llm("gpt-4o-mini", "context", "second"))
+        await wait_for(lambda: self.service.queue.full())
+        await self.service.stop(timeout=0.05)
+        for caller in (running, queued):
+            with self.assertRaises(ServiceClosedError):
+                await caller
+
+class TestServiceServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.analyze = StubAnalyze()
+        self.server = await ServiceServer(ExtractionService(workers=1, queue_size=1, analyze=self.analyze), port=0).start()
+
+    async def asyncTearDown(self):
+        self.analyze.release.set()
+        await self.server.stop(timeout=1)
+
+    async def post(self, body):
+        # Returns the status, the headers and the JSON body of one request on a new connection
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+        data = json.dumps(body).encode()
+        writer.write(b"POST /extract HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n" % len(data) + data)
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        headers = dict(line.split(": ", 1) for line in lines[1:])
+        return int(lines[0].split()[1]), headers, json.loads(payload)
+
+    async def test_extract(self):
+        self.analyze.release.set()
+        status, _, payload = await self.post({"model": "gpt-4o-mini", "context": "context", "prompt": "Hummingbird 42"})
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["record"]["product"], "Hummingbird 42")
+
+    async def test_busy(self):
+        service = self.server.service
+        first = asyncio.create_task(self.post({"model": "gpt-4o-mini", "context": "context", "prompt": "first"}))
+        await wait_for(lambda: service.running == 1)
+        second = asyncio.create_task(self.post({"model": "gpt-4o-mini", "context": "context", "prompt": "second"}))
+        await wait_for(lambda: service.queue.full())
+        status, headers, _ = await self.post({"model": "gpt-4o-mini", "context": "context", "prompt": "third"})
+        self.assertEqual(status, 503)
+        self.assertEqual(headers["Retry-After"], "1")
+        self.analyze.release.set()
+        self.assertEqual([(await request)[0] for request in (first, second)], [200, 200])
+
+    async def test_bad_request(self):
+        status, _, _ = await self.post({"model": "no-such-model", "context": "context", "prompt": "prompt"})
+        self.assertEqual(status, 400)
+
+if __name__ == '__main__':
+    unittest.main()
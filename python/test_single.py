@@ -1,7 +1,8 @@
 # This script is just a helper script to quickly execute a single test on a hard-coded model.
 
 import unittest
-from api_parser import analyze_with_llm
+from api_parser import extract_with_llm
+from datetime import date
 
 default_context = """You are a system assistant that helps to support APIs with their correct parameters. 
         Please extract the needed data from the user input and always return it in the same format as defined here.
@@ -26,27 +27,27 @@ default_prompt = """Hello world, this is a great product so I'd like to order th
 
 class TestApiParser(unittest.TestCase):
 #     def test_analyze_default(self):
-#         result = analyze_with_llm("meta.llama3-70b-instruct-v1:0", default_context, default_prompt)
-#         self.assertIn("NAME: Jan", result)
-#         self.assertIn("MAIL: jan@foo.com", result)
-#         self.assertIn("ADDRESS: Mollstrasse 1", result)
-#         self.assertIn("ZIP: 10117", result)
-#         self.assertIn("LOCATION: Berlin", result)
-#         self.assertIn("COUNTRY: DE", result)
-#         self.assertIn("REQUEST: Order", result)
-#         self.assertIn("PRODUCT: Hummingbird 42", result)
-#         self.assertIn("DATE: 2026-08-12", result)
-#         self.assertIn("TIMEZONE: Europe/Berlin", result)
+#         result = extract_with_llm("meta.llama3-70b-instruct-v1:0", default_context, default_prompt)
+#         self.assertEqual(result.name, "Jan")
+#         self.assertEqual(result.mail, "jan@foo.com")
+#         self.assertEqual(result.address, "Mollstrasse 1")
+#         self.assertEqual(result.zip, "10117")
+#         self.assertEqual(result.location, "Berlin")
+#         self.assertEqual(result.country, "DE")
+#         self.assertEqual(result.request, "Order")
+#         self.assertEqual(result.product, "Hummingbird 42")
+#         self.assertEqual(result.date, date(2026, 8, 12))
+#         self.assertEqual(result.timezone, "Europe/Berlin")
     def test_info(self):
         prompt = """Hello world, this is Jan from Berlin. Can you send me more details about the Hummingbird 42 until 21st of July
         2025? You can reach me at jan@foo.com."""
 
-        result = analyze_with_llm("meta.llama3-70b-instruct-v1:0", default_context, prompt)
+        result = extract_with_llm("meta.llama3-70b-instruct-v1:0", default_context, prompt)
 
-        self.assertIn("MAIL: jan@foo.com", result)
-        self.assertIn("PRODUCT: Hummingbird 42", result)
-        self.assertIn("REQUEST: Info", result)
-        self.assertIn("DATE: 2025-07-21", result)
+        self.assertEqual(result.mail, "jan@foo.com")
+        self.assertEqual(result.product, "Hummingbird 42")
+        self.assertEqual(result.request, "Info")
+        self.assertEqual(result.date, date(2025, 7, 21))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file